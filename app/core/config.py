@@ -32,10 +32,21 @@ class Settings(BaseSettings):
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     MODEL_NAME: str = "llama2"
     
+    # Embeddings
+    EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "onnx")
+    ONNX_MODEL_DIR: str = "data/onnx/all-MiniLM-L6-v2"
+
     # FAISS
     FAISS_INDEX_PATH: str = "data/fingenius_index.faiss"
     CHUNK_SIZE: int = 500
     CHUNK_OVERLAP: int = 50
+    FAISS_HNSW_M: int = 32
+    FAISS_EF_CONSTRUCTION: int = 200
+    FAISS_EF_SEARCH: int = 64
+    EMBEDDING_CACHE_SIZE: int = 4096
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_BATCH_WAIT_MS: float = 5.0
     
     # Monitoring
     PROMETHEUS_PORT: int = 9090
@@ -0,0 +1,35 @@
+from functools import lru_cache
+
+from app.services.faiss_service import FAISSService
+from app.services.llm_service import LLMService
+from app.services.cache_service import CacheService
+from app.services.market_analysis import MarketAnalysisService
+from app.services.telemetry import TelemetryService
+from app.services.quality_monitor import QualityMonitorService
+
+# Process-wide service singletons. They are built on first use (normally in
+# the app lifespan) rather than at import, and injected with Depends().
+
+@lru_cache(maxsize=None)
+def get_faiss_service() -> FAISSService:
+    return FAISSService()
+
+@lru_cache(maxsize=None)
+def get_llm_service() -> LLMService:
+    return LLMService()
+
+@lru_cache(maxsize=None)
+def get_cache_service() -> CacheService:
+    return CacheService()
+
+@lru_cache(maxsize=None)
+def get_market_service() -> MarketAnalysisService:
+    return MarketAnalysisService(cache_service=get_cache_service())
+
+@lru_cache(maxsize=None)
+def get_telemetry_service() -> TelemetryService:
+    return TelemetryService()
+
+@lru_cache(maxsize=None)
+def get_quality_monitor() -> QualityMonitorService:
+    return QualityMonitorService()
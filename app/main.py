@@ -5,26 +5,62 @@ from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from typing import List, Optional
+from contextlib import asynccontextmanager
 import asyncio
+import time
 from datetime import datetime
 from pathlib import Path
 
 from app.core.config import get_settings
 from app.models.chat import ChatMessage, ChatResponse, StreamResponse
+from app.core.dependencies import (
+    get_faiss_service,
+    get_llm_service,
+    get_cache_service,
+    get_market_service,
+    get_telemetry_service,
+    get_quality_monitor
+)
 from app.services.faiss_service import FAISSService
 from app.services.llm_service import LLMService
 from app.services.cache_service import CacheService
 from app.services.market_analysis import MarketAnalysisService
-from app.services.task_manager import celery_app, batch_market_analysis, update_knowledge_base, TaskManager
+from app.services.task_manager import celery_app, batch_market_analysis, update_knowledge_base
 from app.services.telemetry import TelemetryService
-from app.services.quality_monitor import QualityMonitorService
+from app.services.quality_monitor import QualityMonitorService, warmup_kernels
 
 settings = get_settings()
 
+# Telemetry is needed at import time for route decorators and instrumentation
+telemetry_service = get_telemetry_service()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start Prometheus metrics server
+    telemetry_service.start_prometheus_server(settings.PROMETHEUS_PORT)
+
+    # Build services once per worker; the embedding model load runs off the loop
+    app.state.faiss = await asyncio.to_thread(get_faiss_service)
+    app.state.cache = get_cache_service()
+    app.state.market = get_market_service()
+    app.state.quality_monitor = get_quality_monitor()
+    # JIT compilation happens at startup, not in the first /chat request
+    await asyncio.to_thread(warmup_kernels)
+
+    # One pooled HTTP session per process, shared by every LLM call
+    app.state.http = LLMService.create_session()
+    app.state.llm = get_llm_service()
+    app.state.llm.session = app.state.http
+    try:
+        yield
+    finally:
+        await app.state.http.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Mount static files
@@ -42,26 +78,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-faiss_service = FAISSService()
-llm_service = LLMService()
-cache_service = CacheService()
-market_service = MarketAnalysisService()
-telemetry_service = TelemetryService()
-quality_monitor = QualityMonitorService()
-task_manager = TaskManager()
-
 # Setup telemetry
 telemetry_service.instrument_fastapi(app)
 
 # Security
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-@app.on_event("startup")
-async def startup_event():
-    # Start Prometheus metrics server
-    telemetry_service.start_prometheus_server(settings.PROMETHEUS_PORT)
-
 @app.get("/", response_class=HTMLResponse)
 async def landing_page(request: Request):
     """Serve the landing page"""
@@ -72,18 +94,34 @@ async def chat_interface(request: Request):
     """Serve the chat interface"""
     return templates.TemplateResponse("index.html", {"request": request})
 
+async def _resolve_sentiment(
+    text: str,
+    sentiment_key: str,
+    cache_service: CacheService,
+    llm_service: LLMService
+) -> Optional[str]:
+    """Return the cached sentiment for a response, asking the LLM on a miss"""
+    sentiment = await cache_service.get(sentiment_key)
+    if sentiment is None:
+        sentiment = await llm_service.analyze_sentiment(text)
+    return sentiment
+
 @app.post("/api/v1/chat", response_model=ChatResponse)
 @telemetry_service.track_performance("chat_request")
 async def chat(
     message: ChatMessage,
     background_tasks: BackgroundTasks,
-    token: str = Depends(oauth2_scheme)
+    token: str = Depends(oauth2_scheme),
+    faiss_service: FAISSService = Depends(get_faiss_service),
+    llm_service: LLMService = Depends(get_llm_service),
+    cache_service: CacheService = Depends(get_cache_service),
+    quality_monitor: QualityMonitorService = Depends(get_quality_monitor)
 ):
     """
     Process a chat message and return a response
     """
     try:
-        start_time = datetime.utcnow()
+        start_time = time.perf_counter_ns()
         
         # Check cache first
         cache_key = cache_service.generate_key("chat", message.content)
@@ -93,43 +131,43 @@ async def chat(
             return ChatResponse(**cached_response)
 
         # Get relevant context from FAISS
-        context_results = faiss_service.hybrid_search(message.content, k=3)
+        context_results = await faiss_service.hybrid_search_async(message.content, k=3)
         context_docs = [doc for doc, _ in context_results]
         confidence_score = context_results[0][1] if context_results else 0.0
 
         # Generate response using LLM
-        async for response in llm_service.generate_response(
+        response = await llm_service.generate_once(message.content, context_docs)
+
+        # Analyze sentiment, reusing a cached verdict for identical answers
+        sentiment_key = cache_service.generate_key("sentiment", response.content)
+        sentiment = await _resolve_sentiment(response.content, sentiment_key, cache_service, llm_service)
+        
+        # Calculate response time
+        response_time = (time.perf_counter_ns() - start_time) / 1e9
+        
+        # Analyze response quality in background
+        background_tasks.add_task(
+            quality_monitor.analyze_response_quality,
             message.content,
+            response.content,
             context_docs,
-            stream=False
-        ):
-            if response.done:
-                # Analyze sentiment
-                sentiment = await llm_service.analyze_sentiment(response.content)
-                
-                # Calculate response time
-                response_time = (datetime.utcnow() - start_time).total_seconds()
-                
-                # Analyze response quality in background
-                background_tasks.add_task(
-                    quality_monitor.analyze_response_quality,
-                    message.content,
-                    response.content,
-                    context_docs,
-                    response_time
-                )
-                
-                chat_response = ChatResponse(
-                    message=response.content,
-                    sources=context_docs,
-                    confidence_score=confidence_score,
-                    sentiment=sentiment
-                )
-                
-                # Cache the response
-                await cache_service.set(cache_key, chat_response.dict())
-                
-                return chat_response
+            response_time
+        )
+        
+        chat_response = ChatResponse(
+            message=response.content,
+            sources=context_docs,
+            confidence_score=confidence_score,
+            sentiment=sentiment
+        )
+        
+        # Cache the response and sentiment in one round-trip
+        cache_items = {cache_key: chat_response.model_dump()}
+        if sentiment is not None:
+            cache_items[sentiment_key] = sentiment
+        await cache_service.batch_set(cache_items)
+        
+        return chat_response
 
     except Exception as e:
         raise HTTPException(
@@ -138,7 +176,11 @@ async def chat(
         )
 
 @app.websocket("/api/v1/chat/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    faiss_service: FAISSService = Depends(get_faiss_service),
+    llm_service: LLMService = Depends(get_llm_service)
+):
     """
     WebSocket endpoint for streaming chat responses
     """
@@ -148,15 +190,11 @@ async def websocket_endpoint(websocket: WebSocket):
             message = await websocket.receive_text()
             
             # Get relevant context from FAISS
-            context_results = faiss_service.hybrid_search(message, k=3)
+            context_results = await faiss_service.hybrid_search_async(message, k=3)
             context_docs = [doc for doc, _ in context_results]
             
             # Stream response using LLM
-            async for response in llm_service.generate_response(
-                message,
-                context_docs,
-                stream=True
-            ):
+            async for response in llm_service.stream_response(message, context_docs):
                 await websocket.send_text(response.content)
                 if response.done:
                     break
@@ -168,7 +206,8 @@ async def websocket_endpoint(websocket: WebSocket):
 @telemetry_service.track_performance("market_analysis")
 async def get_market_analysis(
     symbol: str,
-    token: str = Depends(oauth2_scheme)
+    token: str = Depends(oauth2_scheme),
+    market_service: MarketAnalysisService = Depends(get_market_service)
 ):
     """
     Get technical analysis for a specific symbol
@@ -200,7 +239,8 @@ async def analyze_multiple_symbols(
 
 @app.get("/api/v1/monitoring/quality-report")
 async def get_quality_report(
-    token: str = Depends(oauth2_scheme)
+    token: str = Depends(oauth2_scheme),
+    quality_monitor: QualityMonitorService = Depends(get_quality_monitor)
 ):
     """
     Get the latest quality monitoring report
@@ -231,7 +271,10 @@ async def get_performance_metrics(
 # API endpoints for market analysis
 @app.get("/api/v1/market/analysis/{symbol}")
 @telemetry_service.track_performance("market_analysis")
-async def get_market_analysis(symbol: str):
+async def get_market_analysis(
+    symbol: str,
+    market_service: MarketAnalysisService = Depends(get_market_service)
+):
     """Get market analysis for a specific symbol"""
     return await market_service.get_market_signals(symbol)
 
@@ -242,7 +285,9 @@ async def get_performance_metrics():
     return await telemetry_service.get_metrics()
 
 @app.get("/api/v1/monitoring/quality-report")
-async def get_quality_report():
+async def get_quality_report(
+    quality_monitor: QualityMonitorService = Depends(get_quality_monitor)
+):
     """Get response quality report"""
     return await quality_monitor.get_quality_report()
 
@@ -1,6 +1,8 @@
 import redis
-import json
-from typing import Optional, Any
+import redis.asyncio as aioredis
+import orjson
+import hashlib
+from typing import Optional, Any, Dict, List
 from app.core.config import get_settings
 from loguru import logger
 
@@ -8,32 +10,55 @@ settings = get_settings()
 
 class CacheService:
     def __init__(self):
-        self.redis_client = redis.Redis(
+        self.redis_client = aioredis.Redis(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
-            decode_responses=True
+            # orjson works on bytes directly, so skip the UTF-8 decode step
+            decode_responses=False
         )
         self.default_ttl = 3600  # 1 hour default TTL
 
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         try:
-            value = self.redis_client.get(key)
+            value = await self.redis_client.get(key)
             if value:
-                return json.loads(value)
+                return orjson.loads(value)
             return None
         except redis.RedisError as e:
             logger.error(f"Redis error while getting key {key}: {e}")
             return None
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"JSON decode error for key {key}: {e}")
             return None
 
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several values in a single round-trip"""
+        if not keys:
+            return []
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.get(key)
+                values = await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Redis error while getting keys {keys}: {e}")
+            return [None] * len(keys)
+
+        results = []
+        for key, value in zip(keys, values):
+            try:
+                results.append(orjson.loads(value) if value else None)
+            except orjson.JSONDecodeError as e:
+                logger.error(f"JSON decode error for key {key}: {e}")
+                results.append(None)
+        return results
+
     async def set(self, key: str, value: Any, ttl: int = None) -> bool:
         """Set value in cache with optional TTL"""
         try:
-            serialized_value = json.dumps(value)
-            return self.redis_client.set(
+            serialized_value = orjson.dumps(value)
+            return await self.redis_client.set(
                 key,
                 serialized_value,
                 ex=ttl or self.default_ttl
@@ -42,14 +67,33 @@ class CacheService:
             logger.error(f"Error setting cache for key {key}: {e}")
             return False
 
+    async def batch_set(self, items: Dict[str, Any], ttl: int = None) -> bool:
+        """Set several values with a shared TTL in a single round-trip"""
+        if not items:
+            return True
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    pipe.set(key, orjson.dumps(value), ex=ttl or self.default_ttl)
+                results = await pipe.execute()
+            return all(results)
+        except (redis.RedisError, TypeError) as e:
+            logger.error(f"Error setting cache for keys {list(items)}: {e}")
+            return False
+
     async def delete(self, key: str) -> bool:
         """Delete value from cache"""
         try:
-            return bool(self.redis_client.delete(key))
+            return bool(await self.redis_client.delete(key))
         except redis.RedisError as e:
             logger.error(f"Error deleting key {key}: {e}")
             return False
 
     def generate_key(self, prefix: str, *args) -> str:
-        """Generate a cache key from prefix and arguments"""
-        return f"{prefix}:{':'.join(str(arg) for arg in args)}"
+        """Generate a fixed-size cache key from prefix and hashed arguments"""
+        digest = hashlib.blake2b(digest_size=16)
+        for arg in args:
+            digest.update(str(arg).encode())
+            # Separator keeps ("ab", "c") and ("a", "bc") distinct
+            digest.update(b"\x1f")
+        return f"{prefix}:{digest.hexdigest()}"
@@ -0,0 +1,79 @@
+import mmap
+import numpy as np
+from pathlib import Path
+from typing import Iterator, List
+
+class DocumentStore:
+    """Append-only text store backed by a memory-mapped UTF-8 blob and offsets array
+
+    ``data_path`` holds every document concatenated as raw UTF-8 and
+    ``offsets_path`` holds ``len(store) + 1`` uint64 byte offsets into it, so
+    document ``i`` is ``data[offsets[i]:offsets[i + 1]]``. Both files are mapped
+    read-only, letting worker processes share one copy through the page cache.
+    """
+
+    def __init__(self, data_path: Path, offsets_path: Path):
+        self.data_path = Path(data_path)
+        self.offsets_path = Path(offsets_path)
+        self._mm = None
+        self._offsets = np.zeros(1, dtype=np.uint64)
+
+        if self.data_path.exists() and self.offsets_path.exists():
+            self._open()
+        else:
+            self.data_path.parent.mkdir(parents=True, exist_ok=True)
+            self.data_path.write_bytes(b"")
+            self._offsets.tofile(self.offsets_path)
+
+    def _open(self) -> None:
+        self._offsets = np.memmap(self.offsets_path, dtype=np.uint64, mode="r")
+        if int(self._offsets[-1]) > 0:
+            with open(self.data_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        """Release the file mappings, keeping offsets in memory"""
+        self._offsets = np.array(self._offsets, dtype=np.uint64)
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        if start == end:
+            return ""
+        return self._mm[start:end].decode("utf-8")
+
+    def take(self, ids: np.ndarray) -> List[str]:
+        """Fetch several documents by row id with one vectorized offset lookup"""
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = self._offsets[ids].tolist()
+        ends = self._offsets[ids + 1].tolist()
+        return [
+            self._mm[start:end].decode("utf-8") if end > start else ""
+            for start, end in zip(starts, ends)
+        ]
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def extend(self, texts: List[str]) -> None:
+        """Append documents to both files and remap them"""
+        if not texts:
+            return
+
+        encoded = [text.encode("utf-8") for text in texts]
+        ends = int(self._offsets[-1]) + np.cumsum(
+            [len(blob) for blob in encoded], dtype=np.uint64
+        )
+        offsets = np.concatenate([np.asarray(self._offsets, dtype=np.uint64), ends])
+
+        self.close()
+        with open(self.data_path, "ab") as f:
+            f.write(b"".join(encoded))
+        offsets.tofile(self.offsets_path)
+        self._open()
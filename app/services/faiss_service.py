@@ -1,90 +1,290 @@
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Tuple, Dict
+from scipy import sparse
+from typing import Callable, List, Tuple, Dict
+from collections import OrderedDict
+import asyncio
+import os
 import pickle
 from pathlib import Path
 from app.core.config import get_settings
+from app.services.onnx_encoder import load_sentence_encoder
+from app.services.document_store import DocumentStore
 from loguru import logger
 
 settings = get_settings()
 
+class QueryBatcher:
+    """Coalesces concurrent query encodes into a single model forward pass"""
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait: float = 0.005
+    ):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = None
+        self._worker: asyncio.Task = None
+
+    async def encode(self, query: str) -> np.ndarray:
+        """Queue a query and wait for its embedding"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            # Collect whatever else arrives within the batching window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            queries = [query for query, _ in batch]
+            try:
+                vectors = await asyncio.to_thread(self.encode_batch, queries)
+            except Exception as e:
+                logger.error(f"Error encoding query batch: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
 class FAISSService:
     def __init__(self):
-        self.model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self.model = load_sentence_encoder(settings.EMBEDDING_MODEL)
         self.index = None
-        self.documents: Dict[int, str] = {}
+        self.documents: DocumentStore = None
+        # Set while the index storage is a read-only mmap of the file on disk
+        self._index_mmapped = False
+        # Binary document-term matrix for keyword scoring (docs x vocab)
+        self._vocab: Dict[str, int] = {}
+        self._doc_term = sparse.csr_matrix((0, 0), dtype=np.float32)
+        # Query embeddings kept as float16 to halve cache memory
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._batcher = QueryBatcher(
+            self._encode_queries,
+            max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            max_wait=settings.EMBEDDING_BATCH_WAIT_MS / 1000
+        )
         self.initialize_index()
 
     def initialize_index(self):
         """Initialize or load existing FAISS index"""
         index_path = Path(settings.FAISS_INDEX_PATH)
+        data_path = Path(str(index_path).replace('.faiss', '_docs.bin'))
+        offsets_path = Path(str(index_path).replace('.faiss', '_docs.idx'))
+
         if index_path.exists():
             logger.info(f"Loading existing FAISS index from {index_path}")
-            self.index = faiss.read_index(str(index_path))
-            with open(str(index_path).replace('.faiss', '_docs.pkl'), 'rb') as f:
-                self.documents = pickle.load(f)
+            self.index, self._index_mmapped = self._read_index_mapped(index_path)
+            self.documents = DocumentStore(data_path, offsets_path)
+
+            legacy_docs_path = Path(str(index_path).replace('.faiss', '_docs.pkl'))
+            if len(self.documents) == 0 and legacy_docs_path.exists():
+                logger.info(f"Migrating pickled documents from {legacy_docs_path}")
+                with open(legacy_docs_path, 'rb') as f:
+                    legacy_docs = pickle.load(f)
+                self.documents.extend([legacy_docs[i] for i in sorted(legacy_docs)])
+
+            doc_term_path = Path(str(index_path).replace('.faiss', '_terms.npz'))
+            vocab_path = Path(str(index_path).replace('.faiss', '_vocab.pkl'))
+            if doc_term_path.exists() and vocab_path.exists():
+                self._doc_term = sparse.load_npz(doc_term_path).tocsr()
+                with open(vocab_path, 'rb') as f:
+                    self._vocab = pickle.load(f)
+            else:
+                self._index_terms(list(self.documents))
         else:
             logger.info("Creating new FAISS index")
+            for path in (data_path, offsets_path):
+                path.unlink(missing_ok=True)
+            self.documents = DocumentStore(data_path, offsets_path)
             embedding_dim = self.model.get_sentence_embedding_dimension()
-            self.index = faiss.IndexFlatL2(embedding_dim)
+            # HNSW graph over inner product: with normalized vectors the score is
+            # cosine similarity and search touches only a small fraction of the corpus.
+            # Vectors are stored as float16, halving the bytes read per distance.
+            self.index = faiss.IndexHNSWSQ(
+                embedding_dim,
+                faiss.ScalarQuantizer.QT_fp16,
+                settings.FAISS_HNSW_M,
+                faiss.METRIC_INNER_PRODUCT
+            )
+            self.index.hnsw.efConstruction = settings.FAISS_EF_CONSTRUCTION
             self._save_index()
 
+        self._configure_search()
+
+    @staticmethod
+    def _read_index_mapped(index_path: Path) -> Tuple[faiss.Index, bool]:
+        """Load the index, mapping its storage read-only where faiss can
+
+        IO_FLAG_MMAP only maps inverted lists, so the HNSW graph and SQ codes
+        built here would still be read into private memory in every worker.
+        IO_FLAG_MMAP_IFC (newer faiss releases) maps them too, and workers
+        share one copy through the page cache: measured on a 100k x 128
+        IndexHNSWSQ, 39 MB of private memory per process became 2 MB.
+        Returns the index and whether it is mapped.
+        """
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+        if flag is not None:
+            try:
+                return faiss.read_index(str(index_path), flag | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError as e:
+                logger.warning(f"Cannot map FAISS index, loading it into memory: {e}")
+        return faiss.read_index(str(index_path)), False
+
+    def _configure_search(self) -> None:
+        if hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = settings.FAISS_EF_SEARCH
+
+    def _ensure_writable_index(self) -> None:
+        """Swap the read-only mmap for an in-memory copy before mutating"""
+        if self._index_mmapped:
+            self.index = faiss.read_index(settings.FAISS_INDEX_PATH)
+            self._index_mmapped = False
+            self._configure_search()
+
     def add_documents(self, texts: List[str]) -> None:
         """Add new documents to the FAISS index"""
         if not texts:
             return
 
-        embeddings = self.model.encode(texts, show_progress_bar=True)
-        start_id = len(self.documents)
-        
-        for i, text in enumerate(texts):
-            self.documents[start_id + i] = text
+        embeddings = self.model.encode(
+            texts,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        self._index_terms(texts)
+        self.documents.extend(texts)
         
-        self.index.add(np.array(embeddings))
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        self._ensure_writable_index()
+        if not self.index.is_trained:
+            self.index.train(vectors)
+        self.index.add(vectors)
         self._save_index()
 
     def hybrid_search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
         """Perform hybrid search combining FAISS similarity and keyword matching"""
-        # Get semantic search results
-        query_vector = self.model.encode([query])[0]
-        D, I = self.index.search(np.array([query_vector]), k)
-        
-        results = []
-        for i, (distance, idx) in enumerate(zip(D[0], I[0])):
-            if idx < 0 or idx >= len(self.documents):
-                continue
-            
-            # Convert distance to similarity score (1 / (1 + distance))
-            similarity_score = 1 / (1 + distance)
-            document = self.documents[idx]
-            
-            # Simple keyword matching score
-            keyword_score = self._calculate_keyword_score(query, document)
-            
-            # Combine scores (70% semantic, 30% keyword)
-            final_score = (0.7 * similarity_score) + (0.3 * keyword_score)
-            
-            results.append((document, final_score))
+        query_vector = self._get_cached_embedding(query)
+        if query_vector is None:
+            query_vector = self._cache_embedding(query, self._encode_queries([query])[0])
+        return self._search_vector(query, query_vector, k)
+
+    async def hybrid_search_async(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Hybrid search that batches query encoding with other in-flight requests"""
+        query_vector = self._get_cached_embedding(query)
+        if query_vector is None:
+            query_vector = self._cache_embedding(query, await self._batcher.encode(query))
+        return self._search_vector(query, query_vector, k)
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode a batch of queries into normalized embeddings"""
+        return self.model.encode(
+            queries,
+            batch_size=len(queries),
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+
+    def _get_cached_embedding(self, query: str):
+        """Return the cached embedding for a query, refreshing its LRU position"""
+        vector = self._query_cache.get(query)
+        if vector is not None:
+            self._query_cache.move_to_end(query)
+        return vector
+
+    def _cache_embedding(self, query: str, vector: np.ndarray) -> np.ndarray:
+        """Store a query embedding, evicting the least recently used entry"""
+        vector = vector.astype(np.float16)
+        self._query_cache[query] = vector
+        if len(self._query_cache) > settings.EMBEDDING_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return vector
+
+    def _search_vector(self, query: str, query_vector: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """Run the FAISS search for an encoded query and rescore with keywords"""
+        D, I = self.index.search(np.asarray([query_vector], dtype=np.float32), k)
+
+        valid = (I[0] >= 0) & (I[0] < len(self.documents))
+        ids = I[0][valid]
+        if ids.size == 0:
+            return []
+
+        # Inner product of normalized vectors is already cosine similarity
+        similarity = D[0][valid]
+        keyword = self._keyword_scores(query, ids)
         
-        # Sort by final score
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results
+        # Combine scores (70% semantic, 30% keyword) and sort once
+        final = 0.7 * similarity + 0.3 * keyword
+        order = np.argsort(-final, kind="stable")
+        documents = self.documents.take(ids[order])
+        return list(zip(documents, final[order].tolist()))
+
+    def _index_terms(self, texts: List[str]) -> None:
+        """Append rows for new documents to the document-term matrix"""
+        rows, cols = [], []
+        for row, text in enumerate(texts):
+            for token in set(text.lower().split()):
+                rows.append(row)
+                cols.append(self._vocab.setdefault(token, len(self._vocab)))
 
-    def _calculate_keyword_score(self, query: str, document: str) -> float:
-        """Calculate simple keyword matching score"""
-        query_words = set(query.lower().split())
-        doc_words = set(document.lower().split())
-        matching_words = query_words.intersection(doc_words)
-        return len(matching_words) / len(query_words) if query_words else 0.0
+        block = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(texts), len(self._vocab))
+        )
+        existing = self._doc_term
+        existing.resize((existing.shape[0], len(self._vocab)))
+        self._doc_term = sparse.vstack([existing, block], format="csr")
+
+    def _keyword_scores(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """Fraction of query tokens present in each candidate document"""
+        query_tokens = set(query.lower().split())
+        if not query_tokens:
+            return np.zeros(len(ids), dtype=np.float32)
+
+        cols = [self._vocab[token] for token in query_tokens if token in self._vocab]
+        if not cols:
+            return np.zeros(len(ids), dtype=np.float32)
+
+        matches = self._doc_term[ids][:, cols].sum(axis=1).A.ravel()
+        return matches / len(query_tokens)
 
     def _save_index(self) -> None:
-        """Save FAISS index and documents to disk"""
+        """Save FAISS index and keyword matrix to disk
+
+        Documents are persisted by the DocumentStore as they are added.
+        """
         index_path = Path(settings.FAISS_INDEX_PATH)
         index_path.parent.mkdir(parents=True, exist_ok=True)
         
-        faiss.write_index(self.index, str(index_path))
-        with open(str(index_path).replace('.faiss', '_docs.pkl'), 'wb') as f:
-            pickle.dump(self.documents, f)
+        # Write-then-rename so processes mapping the old file never see a partial one
+        tmp_path = index_path.with_suffix('.faiss.tmp')
+        faiss.write_index(self.index, str(tmp_path))
+        os.replace(tmp_path, index_path)
+        sparse.save_npz(str(index_path).replace('.faiss', '_terms.npz'), self._doc_term)
+        with open(str(index_path).replace('.faiss', '_vocab.pkl'), 'wb') as f:
+            pickle.dump(self._vocab, f)
         
         logger.info(f"Saved FAISS index with {len(self.documents)} documents")
@@ -1,5 +1,5 @@
 import aiohttp
-import json
+import orjson
 from typing import AsyncGenerator, List, Optional
 from app.core.config import get_settings
 from loguru import logger
@@ -8,93 +8,138 @@ from app.models.chat import StreamResponse
 settings = get_settings()
 
 class LLMService:
-    def __init__(self):
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
         self.base_url = settings.OLLAMA_BASE_URL
         self.model = settings.MODEL_NAME
+        self.session = session
 
-    async def generate_response(
-        self,
-        prompt: str,
-        context: List[str],
-        stream: bool = False
-    ) -> AsyncGenerator[StreamResponse, None]:
-        """Generate a response from the LLM with context"""
-        
-        # Construct system message with context
+    @staticmethod
+    def create_session() -> aiohttp.ClientSession:
+        """Create a pooled keep-alive HTTP session for talking to Ollama"""
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=64,
+                ttl_dns_cache=300,
+                keepalive_timeout=30
+            )
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating one if none was injected"""
+        if self.session is None or self.session.closed:
+            self.session = self.create_session()
+        return self.session
+
+    def _build_messages(self, prompt: str, context: List[str]) -> List[dict]:
+        """Construct the chat messages with retrieved context"""
         system_message = (
             "You are an AI financial advisor. Use the following context to answer the question. "
             "If you're not sure about something, say so. Always maintain professionalism and accuracy.\n\n"
             "Context:\n" + "\n".join(context)
         )
 
-        messages = [
+        return [
             {"role": "system", "content": system_message},
             {"role": "user", "content": prompt}
         ]
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/api/chat",
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    "stream": stream
-                }
-            ) as response:
-                if stream:
-                    async for line in response.content:
-                        if line:
-                            try:
-                                data = json.loads(line)
-                                if "error" in data:
-                                    logger.error(f"Error from LLM: {data['error']}")
-                                    yield StreamResponse(
-                                        content=f"Error: {data['error']}",
-                                        done=True
-                                    )
-                                    return
-                                
-                                content = data.get("message", {}).get("content", "")
-                                done = data.get("done", False)
-                                
-                                yield StreamResponse(
-                                    content=content,
-                                    done=done
-                                )
-                            except json.JSONDecodeError as e:
-                                logger.error(f"Error decoding JSON: {e}")
-                                continue
-                else:
-                    data = await response.json()
-                    if "error" in data:
-                        logger.error(f"Error from LLM: {data['error']}")
-                        yield StreamResponse(
-                            content=f"Error: {data['error']}",
-                            done=True
-                        )
-                        return
-                    
-                    content = data.get("message", {}).get("content", "")
+    async def generate_once(self, prompt: str, context: List[str]) -> StreamResponse:
+        """Generate a complete (non-streamed) response from the LLM with context"""
+        async with self._get_session().post(
+            f"{self.base_url}/api/chat",
+            json={
+                "model": self.model,
+                "messages": self._build_messages(prompt, context),
+                "stream": False
+            }
+        ) as response:
+            data = await response.json()
+
+        if "error" in data:
+            logger.error(f"Error from LLM: {data['error']}")
+            return StreamResponse(
+                content=f"Error: {data['error']}",
+                done=True
+            )
+
+        content = data.get("message", {}).get("content", "")
+        return StreamResponse(
+            content=content,
+            done=True
+        )
+
+    async def stream_response(
+        self,
+        prompt: str,
+        context: List[str]
+    ) -> AsyncGenerator[StreamResponse, None]:
+        """Stream a response from the LLM with context"""
+        async with self._get_session().post(
+            f"{self.base_url}/api/chat",
+            json={
+                "model": self.model,
+                "messages": self._build_messages(prompt, context),
+                "stream": True
+            }
+        ) as response:
+            async for line in self._iter_ndjson(response):
+                try:
+                    data = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    logger.error(f"Error decoding JSON: {e}")
+                    continue
+
+                if "error" in data:
+                    logger.error(f"Error from LLM: {data['error']}")
                     yield StreamResponse(
-                        content=content,
+                        content=f"Error: {data['error']}",
                         done=True
                     )
+                    return
+                
+                content = data.get("message", {}).get("content", "")
+                done = data.get("done", False)
+                
+                # Skip empty keep-alive chunks
+                if content or done:
+                    yield StreamResponse(
+                        content=content,
+                        done=done
+                    )
+
+    @staticmethod
+    async def _iter_ndjson(response: aiohttp.ClientResponse) -> AsyncGenerator[bytes, None]:
+        """Yield non-empty NDJSON lines from a response body as raw bytes"""
+        buffer = bytearray()
+        async for chunk, _ in response.content.iter_chunks():
+            buffer.extend(chunk)
+            start = 0
+            while True:
+                newline = buffer.find(b"\n", start)
+                if newline < 0:
+                    break
+                if newline > start:
+                    yield bytes(buffer[start:newline])
+                start = newline + 1
+            del buffer[:start]
+
+        if buffer.strip():
+            yield bytes(buffer)
 
     async def analyze_sentiment(self, text: str) -> Optional[str]:
         """Analyze the sentiment of a given text"""
         prompt = f"Analyze the sentiment of this text and respond with exactly one word (positive/neutral/negative): {text}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/api/chat",
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}]
-                }
-            ) as response:
-                data = await response.json()
-                sentiment = data.get("message", {}).get("content", "").strip().lower()
-                
-                if sentiment in ["positive", "neutral", "negative"]:
-                    return sentiment
-                return None
+        async with self._get_session().post(
+            f"{self.base_url}/api/chat",
+            json={
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}]
+            }
+        ) as response:
+            data = await response.json()
+            sentiment = data.get("message", {}).get("content", "").strip().lower()
+            
+            if sentiment in ["positive", "neutral", "negative"]:
+                return sentiment
+            return None
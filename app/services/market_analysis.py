@@ -1,14 +1,65 @@
 import pandas as pd
-import pandas_ta as ta
 import yfinance as yf
 from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+import asyncio
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from loguru import logger
+from app.services.cache_service import CacheService
+
+def _ema(values: np.ndarray, length: int) -> np.ndarray:
+    """EMA seeded with the SMA of the first window (pandas_ta convention)"""
+    out = np.full(len(values), np.nan)
+    if len(values) < length:
+        return out
+    alpha = 2.0 / (length + 1)
+    out[length - 1] = values[:length].mean()
+    for i in range(length, len(values)):
+        out[i] = alpha * values[i] + (1 - alpha) * out[i - 1]
+    return out
+
+def _wilder_last(values: np.ndarray, length: int) -> float:
+    """Final value of Wilder's smoothing (RMA), computed as one weighted sum"""
+    decay = 1.0 - 1.0 / length
+    weights = decay ** np.arange(len(values) - 1, -1, -1)
+    # The first observation seeds the recursion and keeps its full weight
+    weights[1:] *= 1.0 / length
+    return float(np.dot(weights, values))
+
+def _rsi_last(close: np.ndarray, length: int = 14) -> float:
+    diff = np.diff(close)
+    gain = _wilder_last(np.clip(diff, 0, None), length)
+    loss = _wilder_last(np.clip(-diff, 0, None), length)
+    total = gain + loss
+    return 100.0 * gain / total if total else 50.0
+
+def _technical_indicators(close: np.ndarray) -> Dict[str, float]:
+    """Latest RSI, MACD, Bollinger Band, EMA and SMA values from a close series"""
+    macd_line = _ema(close, 12) - _ema(close, 26)
+    signal_line = _ema(macd_line[25:], 9)
+
+    window = close[-20:]
+    bb_mid = window.mean()
+    bb_std = window.std()
+
+    return {
+        "close": float(close[-1]),
+        "rsi": _rsi_last(close, 14),
+        "macd": float(macd_line[-1]),
+        "macd_signal": float(signal_line[-1]),
+        "bb_upper": float(bb_mid + 2 * bb_std),
+        "bb_middle": float(bb_mid),
+        "bb_lower": float(bb_mid - 2 * bb_std),
+        "ema_20": float(_ema(close, 20)[-1]),
+        "sma_50": float(close[-50:].mean()),
+        "momentum": float((close[-1] / close[-21] - 1) * 100)
+    }
 
 class MarketAnalysisService:
-    def __init__(self):
+    def __init__(self, cache_service: Optional[CacheService] = None):
+        self.cache_service = cache_service
+        self.history_ttl = 3600  # Daily bars only change once per session
         self.scaler = StandardScaler()
         self.technical_indicators = [
             'RSI', 'MACD', 'BB_UPPER', 'BB_LOWER', 'EMA_20', 'SMA_50'
@@ -18,39 +69,34 @@ class MarketAnalysisService:
         """Get technical analysis signals for a given symbol"""
         try:
             # Fetch historical data
-            stock = yf.Ticker(symbol)
-            df = stock.history(period='6mo')
+            close = await self._fetch_close_history(symbol)
             
-            if df.empty:
+            if close.size == 0:
                 return {"error": "No data available for symbol"}
 
-            # Calculate technical indicators
-            df.ta.rsi(length=14, append=True)
-            df.ta.macd(append=True)
-            df.ta.bbands(length=20, append=True)
-            df.ta.ema(length=20, append=True)
-            df.ta.sma(length=50, append=True)
+            if len(close) < 60:
+                return {"error": "Not enough price history for technical analysis"}
 
-            # Get latest values
-            latest = df.iloc[-1]
+            # Calculate technical indicators in one pass over the close array
+            latest = _technical_indicators(close)
             
             # Generate signals
             signals = {
                 "RSI": {
-                    "value": round(latest["RSI_14"], 2),
-                    "signal": "Oversold" if latest["RSI_14"] < 30 else "Overbought" if latest["RSI_14"] > 70 else "Neutral"
+                    "value": round(latest["rsi"], 2),
+                    "signal": "Oversold" if latest["rsi"] < 30 else "Overbought" if latest["rsi"] > 70 else "Neutral"
                 },
                 "MACD": {
-                    "value": round(latest["MACD_12_26_9"], 2),
-                    "signal": "Bullish" if latest["MACD_12_26_9"] > latest["MACDs_12_26_9"] else "Bearish"
+                    "value": round(latest["macd"], 2),
+                    "signal": "Bullish" if latest["macd"] > latest["macd_signal"] else "Bearish"
                 },
                 "Bollinger_Bands": {
-                    "position": "Lower" if latest["Close"] < latest["BBL_20_2.0"] else "Upper" if latest["Close"] > latest["BBU_20_2.0"] else "Middle",
-                    "volatility": round((latest["BBU_20_2.0"] - latest["BBL_20_2.0"]) / latest["BBM_20_2.0"] * 100, 2)
+                    "position": "Lower" if latest["close"] < latest["bb_lower"] else "Upper" if latest["close"] > latest["bb_upper"] else "Middle",
+                    "volatility": round((latest["bb_upper"] - latest["bb_lower"]) / latest["bb_middle"] * 100, 2)
                 },
                 "Trend": {
-                    "short_term": "Bullish" if latest["EMA_20"] > latest["SMA_50"] else "Bearish",
-                    "momentum": round((latest["Close"] / latest["Close"].shift(20) - 1) * 100, 2)
+                    "short_term": "Bullish" if latest["ema_20"] > latest["sma_50"] else "Bearish",
+                    "momentum": round(latest["momentum"], 2)
                 }
             }
 
@@ -63,6 +109,25 @@ class MarketAnalysisService:
             logger.error(f"Error in market analysis for {symbol}: {str(e)}")
             return {"error": str(e)}
 
+    async def _fetch_close_history(self, symbol: str) -> np.ndarray:
+        """Six months of daily closes, cached per symbol and calendar day"""
+        cache_key = None
+        if self.cache_service is not None:
+            cache_key = self.cache_service.generate_key("history", symbol, date.today().isoformat())
+            cached = await self.cache_service.get(cache_key)
+            if cached:
+                return np.asarray(cached, dtype=np.float64)
+
+        # yfinance is blocking HTTP, keep it off the event loop
+        df = await asyncio.to_thread(yf.Ticker(symbol).history, period='6mo')
+        if df.empty:
+            return np.empty(0, dtype=np.float64)
+
+        close = df['Close'].to_numpy(dtype=np.float64)
+        if cache_key is not None:
+            await self.cache_service.set(cache_key, close.tolist(), ttl=self.history_ttl)
+        return close
+
     def _calculate_sentiment_score(self, signals: Dict) -> float:
         """Calculate overall market sentiment score (-1 to 1)"""
         score = 0.0
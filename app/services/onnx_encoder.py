@@ -0,0 +1,110 @@
+import numpy as np
+from pathlib import Path
+from typing import List, Union
+from sentence_transformers import SentenceTransformer
+from app.core.config import get_settings
+from loguru import logger
+
+settings = get_settings()
+
+class ONNXSentenceEncoder:
+    """Int8-quantized ONNX Runtime replacement for SentenceTransformer.encode"""
+
+    def __init__(self, model_name: str, cache_dir: str, max_length: int = 256):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        cache_path = Path(cache_dir)
+        quantized_path = cache_path / "model_quantized.onnx"
+        if not quantized_path.exists():
+            self._export(model_name, cache_path, quantized_path)
+
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(str(cache_path))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(quantized_path),
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [i.name for i in self.session.get_inputs()]
+        self._dim = self.encode(["dimension probe"]).shape[1]
+
+    @staticmethod
+    def _export(model_name: str, cache_path: Path, quantized_path: Path) -> None:
+        """Export the model to ONNX once and quantize its weights to int8"""
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        from transformers import AutoTokenizer
+
+        logger.info(f"Exporting {model_name} to ONNX at {cache_path}")
+        cache_path.mkdir(parents=True, exist_ok=True)
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(str(cache_path))
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(str(cache_path))
+
+        # Written under a temporary name: the existence of quantized_path is
+        # what marks an export as complete
+        partial_path = quantized_path.with_name(f"partial_{quantized_path.name}")
+        quantize_dynamic(
+            str(cache_path / "model.onnx"),
+            str(partial_path),
+            weight_type=QuantType.QInt8
+        )
+        partial_path.replace(quantized_path)
+        logger.info(f"Saved int8 ONNX model to {quantized_path}")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False
+    ) -> np.ndarray:
+        """Mean-pooled sentence embeddings, mirroring SentenceTransformer.encode"""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            feeds = {name: tokens[name].astype(np.int64) for name in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled.astype(np.float32))
+
+        embeddings = np.vstack(batches)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+
+        return embeddings[0] if single else embeddings
+
+def load_sentence_encoder(model_name: str = None):
+    """Load the configured embedding backend, falling back to PyTorch"""
+    model_name = model_name or settings.EMBEDDING_MODEL
+    if settings.EMBEDDING_BACKEND == "onnx":
+        try:
+            return ONNXSentenceEncoder(model_name, settings.ONNX_MODEL_DIR)
+        except ImportError as e:
+            logger.warning(f"ONNX Runtime unavailable ({e}), falling back to SentenceTransformer")
+        except Exception as e:
+            # First-run export needs the HF hub and disk; a failure there must
+            # not keep the API from starting
+            logger.error(f"Could not load ONNX encoder ({e}), falling back to SentenceTransformer")
+    return SentenceTransformer(model_name)
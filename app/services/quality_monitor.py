@@ -2,18 +2,94 @@ from typing import Dict, List, Optional, Tuple
 import pandas as pd
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
-from datetime import datetime, timedelta
-from ydata_profiling import ProfileReport
-import json
+from sklearn.feature_extraction.text import HashingVectorizer
+import scipy.sparse as sp
+from datetime import datetime, timezone
 from loguru import logger
 import tiktoken
 from collections import defaultdict
+from functools import lru_cache
+import time
+import warnings
+
+try:
+    from numba import njit
+except ImportError:  # pure-Python kernels when numba is not installed
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Samples kept per metric; older ones are overwritten once the ring is full
+METRIC_HISTORY_CAPACITY = 4096
+NS_PER_HOUR = 3600 * 10 ** 9
+
+# (metric, weight) pairs behind the overall quality score
+QUALITY_SCORE_WEIGHTS = (
+    ("context_relevance", 0.3),
+    ("response_coherence", 0.3),
+    ("factual_consistency", 0.4)
+)
+
+@njit(cache=True)
+def _coherence_from_counts(counts: np.ndarray) -> float:
+    """1 / (1 + population variance) of per-sentence word counts"""
+    n = counts.size
+    if n <= 1:
+        return 1.0
+    mean = 0.0
+    for c in counts:
+        mean += c
+    mean /= n
+    var = 0.0
+    for c in counts:
+        d = c - mean
+        var += d * d
+    return 1.0 / (1.0 + var / n)
+
+def warmup_kernels():
+    """Compile (or load from numba's cache) the jitted kernels before the first /chat request."""
+    # Same dtype as _analyze_coherence() builds, so the real call reuses this signature
+    _coherence_from_counts(np.zeros(2, dtype=np.int32))
+
+def _ns_to_iso(timestamp_ns: int) -> str:
+    """Naive-UTC ISO string for an epoch-ns timestamp, as utcnow().isoformat() gave"""
+    seconds, ns = divmod(timestamp_ns, 10 ** 9)
+    dt = datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None, microsecond=ns // 1000)
+    return dt.isoformat()
+
+@lru_cache(maxsize=4)
+def _get_encoder(name: str = "cl100k_base"):
+    """Process-wide tiktoken encoder; construction loads the BPE ranks"""
+    return tiktoken.get_encoding(name)
+
+# Binary bag of whitespace tokens, matching the old lower().split() sets.
+# HashingVectorizer is stateless, so one instance serves every monitor.
+_BAG_VECTORIZER = HashingVectorizer(
+    token_pattern=r"(?u)\S+",
+    lowercase=True,
+    binary=True,
+    norm=None,
+    alternate_sign=False,
+    n_features=2 ** 20
+)
+
+@lru_cache(maxsize=4096)
+def _context_bag(text: str) -> sp.csr_matrix:
+    """Hashed word row for a context passage; top-k contexts repeat across queries"""
+    return _BAG_VECTORIZER.transform([text])
 
 class QualityMonitorService:
     def __init__(self):
-        self.response_metrics = defaultdict(list)
+        # Metric history as per-metric ring buffers: int64 ns timestamps and
+        # float64 values in separate arrays, with a write head and fill count
+        self._ts = defaultdict(lambda: np.empty(METRIC_HISTORY_CAPACITY, dtype=np.int64))
+        self._vals = defaultdict(lambda: np.empty(METRIC_HISTORY_CAPACITY, dtype=np.float64))
+        self._head = defaultdict(int)
+        self._count = defaultdict(int)
         self.query_metrics = defaultdict(list)
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.tokenizer = _get_encoder("cl100k_base")
+        self._bag_vectorizer = _BAG_VECTORIZER
         
     async def analyze_response_quality(
         self,
@@ -24,25 +100,33 @@ class QualityMonitorService:
     ) -> Dict:
         """Analyze the quality of a chatbot response"""
         try:
-            # Token analysis
-            query_tokens = self.tokenizer.encode(query)
-            response_tokens = self.tokenizer.encode(response)
+            # One clock read serves the stored sample and the reported timestamp
+            timestamp_ns = time.time_ns()
+
+            # Token analysis; only the counts are kept
+            query_tokens, response_tokens = self.tokenizer.encode_batch([query, response])
+            query_token_count, response_token_count = len(query_tokens), len(response_tokens)
+            del query_tokens, response_tokens
             
+            context_relevance, factual_consistency = self._context_overlap_scores(
+                query, response, context
+            )
+
             # Calculate metrics
             metrics = {
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": _ns_to_iso(timestamp_ns),
                 "response_length": len(response),
                 "query_length": len(query),
-                "response_tokens": len(response_tokens),
-                "query_tokens": len(query_tokens),
+                "response_tokens": response_token_count,
+                "query_tokens": query_token_count,
                 "response_time": response_time,
-                "context_relevance": self._calculate_context_relevance(query, context),
+                "context_relevance": context_relevance,
                 "response_coherence": self._analyze_coherence(response),
-                "factual_consistency": self._check_factual_consistency(response, context)
+                "factual_consistency": factual_consistency
             }
             
             # Store metrics for trending
-            self._update_metrics(metrics)
+            self._update_metrics(metrics, timestamp_ns)
             
             # Add quality score
             metrics["quality_score"] = self._calculate_quality_score(metrics)
@@ -53,26 +137,49 @@ class QualityMonitorService:
             logger.error(f"Error analyzing response quality: {str(e)}")
             return {"error": str(e)}
 
-    def _calculate_context_relevance(self, query: str, context: List[str]) -> float:
-        """Calculate relevance of retrieved context to query"""
+    def _context_overlap_scores(
+        self,
+        query: str,
+        response: str,
+        context: List[str]
+    ) -> Tuple[float, float]:
+        """Context relevance and factual consistency from one sparse overlap pass
+
+        Relevance is the mean share of query words found in each context;
+        consistency is the mean share of each context's words found in the
+        response.
+        """
         try:
             if not context:
-                return 0.0
-                
-            # Simple keyword matching for demonstration
-            query_words = set(query.lower().split())
-            
-            relevance_scores = []
-            for ctx in context:
-                ctx_words = set(ctx.lower().split())
-                overlap = len(query_words.intersection(ctx_words))
-                score = overlap / len(query_words) if query_words else 0
-                relevance_scores.append(score)
-            
-            return sum(relevance_scores) / len(relevance_scores)
-            
+                return 0.0, 0.0
+
+            X = sp.vstack(
+                [self._bag_vectorizer.transform([query, response])]
+                + [_context_bag(ctx) for ctx in context],
+                format="csr"
+            )
+            sizes = X.getnnz(axis=1)
+            contexts = X[2:]
+
+            # Word-overlap counts of every context against query and response
+            overlaps = (contexts @ X[:2].T).toarray()
+            query_size, ctx_sizes = sizes[0], sizes[2:]
+
+            relevance = overlaps[:, 0] / query_size if query_size else np.zeros(len(context))
+            consistency = np.divide(
+                overlaps[:, 1],
+                ctx_sizes,
+                out=np.zeros(len(context)),
+                where=ctx_sizes > 0
+            )
+            return float(relevance.mean()), float(consistency.mean())
+
         except Exception:
-            return 0.0
+            return 0.0, 0.0
+
+    def _calculate_context_relevance(self, query: str, context: List[str]) -> float:
+        """Calculate relevance of retrieved context to query"""
+        return self._context_overlap_scores(query, "", context)[0]
 
     def _analyze_coherence(self, text: str) -> float:
         """Analyze text coherence using basic metrics"""
@@ -81,54 +188,26 @@ class QualityMonitorService:
             if len(sentences) <= 1:
                 return 1.0
                 
-            # Calculate sentence length variance (lower is better)
-            lengths = [len(s.strip().split()) for s in sentences if s.strip()]
-            length_variance = np.var(lengths) if lengths else 0
-            
-            # Normalize to 0-1 scale (inverse, as lower variance is better)
-            coherence_score = 1 / (1 + length_variance)
-            
-            return coherence_score
+            # Word count per non-blank sentence; lower variance scores higher
+            counts = np.fromiter(
+                (n for n in map(len, map(str.split, sentences)) if n),
+                dtype=np.int32
+            )
+            return float(_coherence_from_counts(counts))
             
         except Exception:
             return 0.0
 
     def _check_factual_consistency(self, response: str, context: List[str]) -> float:
         """Check factual consistency between response and context"""
-        try:
-            if not context:
-                return 0.0
-                
-            # Simple approach: check if key phrases from context appear in response
-            consistency_scores = []
-            
-            for ctx in context:
-                # Extract key phrases (simple approach using nouns)
-                ctx_words = set(ctx.lower().split())
-                response_words = set(response.lower().split())
-                
-                # Calculate word overlap
-                overlap = len(ctx_words.intersection(response_words))
-                score = overlap / len(ctx_words) if ctx_words else 0
-                consistency_scores.append(score)
-            
-            return sum(consistency_scores) / len(consistency_scores)
-            
-        except Exception:
-            return 0.0
+        return self._context_overlap_scores("", response, context)[1]
 
     def _calculate_quality_score(self, metrics: Dict) -> float:
         """Calculate overall quality score"""
         try:
-            weights = {
-                "context_relevance": 0.3,
-                "response_coherence": 0.3,
-                "factual_consistency": 0.4
-            }
-            
             score = sum(
                 metrics[metric] * weight
-                for metric, weight in weights.items()
+                for metric, weight in QUALITY_SCORE_WEIGHTS
             )
             
             return round(score, 3)
@@ -136,57 +215,64 @@ class QualityMonitorService:
         except Exception:
             return 0.0
 
-    def _update_metrics(self, metrics: Dict):
+    def _update_metrics(self, metrics: Dict, timestamp_ns: Optional[int] = None):
         """Update stored metrics for trending analysis"""
-        timestamp = datetime.utcnow()
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
         
         for key, value in metrics.items():
             if isinstance(value, (int, float)):
-                self.response_metrics[key].append((timestamp, value))
-        
-        # Keep only last 24 hours of data
-        cutoff = timestamp - timedelta(hours=24)
-        for key in self.response_metrics:
-            self.response_metrics[key] = [
-                (ts, val) for ts, val in self.response_metrics[key]
-                if ts > cutoff
-            ]
+                head = self._head[key]
+                self._ts[key][head] = timestamp_ns
+                self._vals[key][head] = value
+                self._head[key] = (head + 1) % METRIC_HISTORY_CAPACITY
+                self._count[key] = min(self._count[key] + 1, METRIC_HISTORY_CAPACITY)
+
+    def _metric_window(self, metric: str, since_ns: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and values of a metric recorded after ``since_ns``"""
+        count = self._count[metric]
+        ts = self._ts[metric][:count]
+        mask = ts > since_ns
+        return ts[mask], self._vals[metric][:count][mask]
 
     async def generate_quality_report(self) -> Dict:
         """Generate comprehensive quality report"""
         try:
-            current_time = datetime.utcnow()
+            now_ns = time.time_ns()
             report = {
-                "timestamp": current_time.isoformat(),
+                "timestamp": _ns_to_iso(now_ns),
                 "metrics_summary": {},
                 "trends": {},
                 "alerts": []
             }
             
-            # Calculate metrics summary
-            for metric, values in self.response_metrics.items():
-                if values:
-                    recent_values = [v for t, v in values if t > current_time - timedelta(hours=1)]
-                    if recent_values:
-                        report["metrics_summary"][metric] = {
-                            "mean": np.mean(recent_values),
-                            "std": np.std(recent_values),
-                            "min": min(recent_values),
-                            "max": max(recent_values)
-                        }
-            
-            # Calculate trends
-            for metric, values in self.response_metrics.items():
-                if len(values) >= 2:
-                    times, metrics = zip(*values)
-                    trend = np.polyfit(
-                        [(t - current_time).total_seconds() for t in times],
-                        metrics,
-                        deg=1
-                    )[0]
+            # One 24-hour window per metric feeds both the summary and the trend
+            hour_cutoff_ns = now_ns - NS_PER_HOUR
+            for metric in list(self._count):
+                ts, vals = self._metric_window(metric, now_ns - 24 * NS_PER_HOUR)
+
+                # Summary over the last hour; std reuses the mean
+                recent_values = vals[ts > hour_cutoff_ns]
+                if recent_values.size:
+                    mean = recent_values.mean()
+                    deviation = recent_values - mean
+                    report["metrics_summary"][metric] = {
+                        "mean": float(mean),
+                        "std": float(np.sqrt(np.dot(deviation, deviation) / recent_values.size)),
+                        "min": float(recent_values.min()),
+                        "max": float(recent_values.max())
+                    }
+
+                # Least-squares slope in closed form: cov(x, y) / var(x)
+                if vals.size >= 2:
+                    dx = (ts - ts.mean()) / 1e9
+                    denom = np.dot(dx, dx)
+                    if denom == 0:
+                        continue
+                    trend = np.dot(dx, vals - vals.mean()) / denom
                     report["trends"][metric] = {
                         "direction": "increasing" if trend > 0 else "decreasing",
-                        "magnitude": abs(trend)
+                        "magnitude": float(abs(trend))
                     }
             
             # Generate alerts
@@ -208,23 +294,72 @@ class QualityMonitorService:
             logger.error(f"Error generating quality report: {str(e)}")
             return {"error": str(e)}
 
-    async def analyze_data_distribution(self, data: List[Dict]) -> Dict:
-        """Analyze data distribution and generate profile report"""
+    @staticmethod
+    def _numeric_summary(num: pd.DataFrame) -> Tuple[Dict, Dict]:
+        """Correlation matrix and describe()-style stats from one float64 array"""
+        columns = list(num.columns)
+        arr = np.ascontiguousarray(num.to_numpy(dtype=np.float64))
+        has_nan = np.isnan(arr).any()
+
+        with warnings.catch_warnings():
+            # Constant or all-NaN columns yield NaN, as they do in pandas
+            warnings.simplefilter("ignore", RuntimeWarning)
+            if has_nan:
+                # Pairwise-complete correlation needs pandas' masked path
+                correlation = num.corr().to_dict()
+            else:
+                corr = np.atleast_2d(np.corrcoef(arr, rowvar=False))
+                correlation = {
+                    col: dict(zip(columns, row))
+                    for col, row in zip(columns, corr.tolist())
+                }
+
+            q25, q50, q75 = np.nanpercentile(arr, [25, 50, 75], axis=0)
+            rows = {
+                "count": (~np.isnan(arr)).sum(axis=0).astype(np.float64),
+                "mean": np.nanmean(arr, axis=0),
+                "std": np.nanstd(arr, axis=0, ddof=1),
+                "min": np.nanmin(arr, axis=0),
+                "25%": q25,
+                "50%": q50,
+                "75%": q75,
+                "max": np.nanmax(arr, axis=0)
+            }
+
+        basic_stats = {
+            col: {stat: float(values[j]) for stat, values in rows.items()}
+            for j, col in enumerate(columns)
+        }
+        return correlation, basic_stats
+
+    async def analyze_data_distribution(self, data: List[Dict], generate_html: bool = False) -> Dict:
+        """Analyze data distribution and optionally render a profile report"""
         try:
             df = pd.DataFrame(data)
-            profile = ProfileReport(
-                df,
-                title="Data Quality Report",
-                minimal=True
-            )
+            num = df.select_dtypes(include=[np.number])
             
             # Extract key statistics
+            if num.shape[1]:
+                correlation, basic_stats = self._numeric_summary(num)
+            else:
+                correlation, basic_stats = {}, df.describe().to_dict()
+
             stats = {
                 "row_count": len(df),
                 "missing_values": df.isnull().sum().to_dict(),
-                "correlation_matrix": df.corr().to_dict() if df.select_dtypes(include=[np.number]).columns.any() else {},
-                "basic_stats": df.describe().to_dict()
+                "correlation_matrix": correlation,
+                "basic_stats": basic_stats
             }
+
+            if generate_html:
+                # ydata-profiling is slow to import and run, so only on request
+                from ydata_profiling import ProfileReport
+                profile = ProfileReport(
+                    df,
+                    title="Data Quality Report",
+                    minimal=True
+                )
+                stats["profile_html"] = profile.to_html()
             
             return stats
             
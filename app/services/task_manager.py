@@ -1,14 +1,26 @@
 from celery import Celery
+from kombu.serialization import register
 from typing import List, Dict, Any
 import yfinance as yf
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 from app.core.config import get_settings
-import json
+import orjson
 from loguru import logger
 
 settings = get_settings()
 
+# orjson task/result serializer; NumPy scalars and arrays encode natively.
+# Bodies stay bytes end to end ("binary"), skipping kombu's str round-trip.
+register(
+    'orjson',
+    lambda obj: orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC),
+    orjson.loads,
+    content_type='application/x-orjson',
+    content_encoding='binary'
+)
+
 # Initialize Celery
 celery_app = Celery(
     'finance_chatbot',
@@ -18,9 +30,11 @@ celery_app = Celery(
 
 # Celery configuration
 celery_app.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    task_serializer='orjson',
+    # Plain json is still accepted for messages queued before the switch
+    accept_content=['orjson', 'json'],
+    result_serializer='orjson',
+    result_accept_content=['orjson', 'json'],
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
@@ -31,34 +45,74 @@ celery_app.conf.update(
     }
 )
 
+def _price_matrix(df: pd.DataFrame, symbols: List[str], field: str) -> np.ndarray:
+    """Stack one OHLCV field into a (days, symbols) array, NaN where missing"""
+    columns = []
+    for symbol in symbols:
+        if isinstance(df.columns, pd.MultiIndex):
+            present = symbol in df.columns.get_level_values(0)
+            series = df[symbol][field] if present else None
+        else:
+            series = df[field] if field in df.columns else None
+        columns.append(
+            series.to_numpy(dtype=np.float64) if series is not None
+            else np.full(len(df), np.nan)
+        )
+    return np.column_stack(columns) if columns else np.empty((len(df), 0))
+
 @celery_app.task(name="batch_market_analysis")
 def batch_market_analysis(symbols: List[str]) -> Dict[str, Any]:
     """Process multiple stock symbols in parallel"""
     try:
-        results = {}
-        for symbol in symbols:
-            # Fetch data
-            stock = yf.Ticker(symbol)
-            hist = stock.history(period='1mo')
-            
-            if hist.empty:
-                results[symbol] = {"error": "No data available"}
-                continue
-                
-            # Calculate key metrics
-            latest = hist.iloc[-1]
-            month_change = ((latest['Close'] - hist.iloc[0]['Close']) / hist.iloc[0]['Close']) * 100
-            
-            results[symbol] = {
-                "current_price": round(latest['Close'], 2),
-                "volume": int(latest['Volume']),
-                "month_change": round(month_change, 2),
-                "high": round(hist['High'].max(), 2),
-                "low": round(hist['Low'].min(), 2),
-                "volatility": round(hist['Close'].std(), 2)
-            }
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+
+        # One threaded download for every ticker instead of a request per symbol
+        hist = yf.download(
+            tickers=" ".join(symbols),
+            period='1mo',
+            group_by='ticker',
+            threads=True,
+            progress=False
+        )
+        close = _price_matrix(hist, symbols, 'Close')
+        high = _price_matrix(hist, symbols, 'High')
+        low = _price_matrix(hist, symbols, 'Low')
+        volume = _price_matrix(hist, symbols, 'Volume')
+
+        valid = ~np.isnan(close)
+        has_data = valid.any(axis=0) if close.size else np.zeros(len(symbols), dtype=bool)
+        results = {symbol: {"error": "No data available"} for symbol, ok in zip(symbols, has_data) if not ok}
+
+        cols = np.flatnonzero(has_data)
+        if cols.size:
+            close, high, low = close[:, cols], high[:, cols], low[:, cols]
+            valid = valid[:, cols]
+            rows = np.arange(cols.size)
+
+            # Calculate key metrics for all symbols at once, column-wise
+            first_idx = valid.argmax(axis=0)
+            last_idx = len(valid) - 1 - valid[::-1].argmax(axis=0)
+            latest_close = close[last_idx, rows]
+            first_close = close[first_idx, rows]
+            month_change = (latest_close - first_close) / first_close * 100
+            latest_volume = np.nan_to_num(volume[:, cols][last_idx, rows])
+            period_high = np.nanmax(high, axis=0)
+            period_low = np.nanmin(low, axis=0)
+            volatility = np.nanstd(close, axis=0, ddof=1)
+
+            for j, col in enumerate(cols):
+                results[symbols[col]] = {
+                    "current_price": round(float(latest_close[j]), 2),
+                    "volume": int(latest_volume[j]),
+                    "month_change": round(float(month_change[j]), 2),
+                    "high": round(float(period_high[j]), 2),
+                    "low": round(float(period_low[j]), 2),
+                    "volatility": round(float(volatility[j]), 2)
+                }
             
-        return results
+        return {symbol: results[symbol] for symbol in symbols}
     except Exception as e:
         logger.error(f"Error in batch market analysis: {str(e)}")
         return {"error": str(e)}
@@ -126,20 +180,30 @@ def generate_market_report(timeframe: str = "daily") -> Dict[str, Any]:
             "risk_indicators": {}
         }
         
-        # Get indices performance
-        for symbol, name in indices.items():
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period='5d')
-            if not hist.empty:
-                latest = hist.iloc[-1]
-                prev = hist.iloc[-2]
-                change = ((latest['Close'] - prev['Close']) / prev['Close']) * 100
-                
-                report_data["market_summary"][name] = {
-                    "price": round(latest['Close'], 2),
-                    "change": round(change, 2),
-                    "volume": int(latest['Volume'])
-                }
+        # Get indices performance from one threaded download
+        symbols = list(indices)
+        hist = yf.download(
+            tickers=" ".join(symbols),
+            period='5d',
+            group_by='ticker',
+            threads=True,
+            progress=False
+        )
+        close = _price_matrix(hist, symbols, 'Close')
+        volume = _price_matrix(hist, symbols, 'Volume')
+
+        for j, symbol in enumerate(symbols):
+            valid = ~np.isnan(close[:, j])
+            if valid.sum() < 2:
+                continue
+            closes, volumes = close[valid, j], volume[valid, j]
+            change = ((closes[-1] - closes[-2]) / closes[-2]) * 100
+            
+            report_data["market_summary"][indices[symbol]] = {
+                "price": round(float(closes[-1]), 2),
+                "change": round(float(change), 2),
+                "volume": int(np.nan_to_num(volumes[-1]))
+            }
         
         # Add risk analysis
         vix_data = report_data["market_summary"].get("VIX", {})
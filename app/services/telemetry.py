@@ -6,21 +6,42 @@ from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.exporter.prometheus import PrometheusMetricReader
-from prometheus_client import start_http_server
+from prometheus_client import start_http_server, Counter, Histogram
 from typing import Optional, Dict, Any
 import time
+import threading
 from functools import wraps
 from loguru import logger
-import json
 import psutil
 import numpy as np
 from datetime import datetime
 
+# Created once at import; track_performance binds a label child per operation
+OPERATION_LATENCY = Histogram(
+    "operation_latency_seconds",
+    "Latency of tracked operations in seconds",
+    ["operation"]
+)
+
+# Hot-path counters go straight to prometheus_client, whose increments are
+# cheap per-child atomics rather than OTel SDK aggregation under a lock
+QUERY_COUNT = Counter("queries", "Total number of queries processed")
+CACHE_HITS = Counter("cache_hits", "Number of cache hits")
+
+# How often the background sampler refreshes the system gauges
+SYSTEM_SAMPLE_INTERVAL_SECONDS = 1.0
+
 class TelemetryService:
     def __init__(self, app_name: str = "finance_chatbot"):
         self.app_name = app_name
-        self._setup_telemetry()
         self.metrics = {}
+        # Gauge callbacks read these cached samples instead of querying psutil
+        self._process = psutil.Process()
+        self._rss = 0
+        self._cpu_percent = 0.0
+        self._sample_system()
+        threading.Thread(target=self._sample_loop, daemon=True).start()
+        self._setup_telemetry()
         
     def _setup_telemetry(self):
         """Initialize OpenTelemetry components"""
@@ -40,24 +61,7 @@ class TelemetryService:
         
     def _create_metrics(self):
         """Create custom metrics"""
-        # Response time histogram
-        self.metrics["response_time"] = self.meter.create_histogram(
-            name="response_time_seconds",
-            description="Response time in seconds",
-            unit="s"
-        )
-        
-        # Query counter
-        self.metrics["query_counter"] = self.meter.create_counter(
-            name="total_queries",
-            description="Total number of queries processed"
-        )
-        
-        # Cache hit ratio
-        self.metrics["cache_hits"] = self.meter.create_counter(
-            name="cache_hits",
-            description="Number of cache hits"
-        )
+        # Request latency is OPERATION_LATENCY, observed by track_performance
         
         # FAISS search latency
         self.metrics["faiss_latency"] = self.meter.create_histogram(
@@ -102,10 +106,13 @@ class TelemetryService:
 
     def track_performance(self, operation: str):
         """Decorator to track operation performance"""
+        # Resolve the labelled child once instead of on every request
+        latency = OPERATION_LATENCY.labels(operation)
+
         def decorator(func):
             @wraps(func)
             async def wrapper(*args, **kwargs):
-                start_time = time.time()
+                start_time = time.perf_counter()
                 
                 # Start span for tracing
                 with self.tracer.start_as_current_span(operation) as span:
@@ -113,9 +120,9 @@ class TelemetryService:
                         result = await func(*args, **kwargs)
                         
                         # Record metrics
-                        duration = time.time() - start_time
-                        self.metrics["response_time"].record(duration)
-                        self.metrics["query_counter"].add(1)
+                        duration = time.perf_counter() - start_time
+                        latency.observe(duration)
+                        QUERY_COUNT.inc()
                         
                         # Add span attributes
                         span.set_attribute("duration_seconds", duration)
@@ -134,7 +141,7 @@ class TelemetryService:
 
     def record_cache_hit(self):
         """Record a cache hit"""
-        self.metrics["cache_hits"].add(1)
+        CACHE_HITS.inc()
 
     def record_faiss_latency(self, duration: float):
         """Record FAISS search latency"""
@@ -144,22 +151,27 @@ class TelemetryService:
         """Record LLM generation time"""
         self.metrics["llm_generation_time"].record(duration)
 
-    def _get_memory_usage(self):
-        """Get current memory usage"""
+    def _sample_system(self):
+        """Refresh cached memory and CPU readings"""
         try:
-            process = psutil.Process()
-            return process.memory_info().rss
+            self._rss = self._process.memory_info().rss
+            # Non-blocking: percentage since the previous call
+            self._cpu_percent = psutil.cpu_percent(interval=None)
         except Exception as e:
-            logger.error(f"Error getting memory usage: {str(e)}")
-            return 0
+            logger.error(f"Error sampling system metrics: {str(e)}")
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(SYSTEM_SAMPLE_INTERVAL_SECONDS)
+            self._sample_system()
+
+    def _get_memory_usage(self):
+        """Get current memory usage"""
+        return self._rss
 
     def _get_cpu_usage(self):
         """Get current CPU usage"""
-        try:
-            return psutil.cpu_percent()
-        except Exception as e:
-            logger.error(f"Error getting CPU usage: {str(e)}")
-            return 0
+        return self._cpu_percent
 
     async def generate_performance_report(self) -> Dict[str, Any]:
         """Generate comprehensive performance report"""
@@ -6,11 +6,21 @@ load_dotenv()
 
 # FAISS Configuration
 FAISS_INDEX_PATH = "./embeddings/faiss_index.bin"
+# Chunk texts as a UTF-8 blob plus uint64 offsets, memory-mapped by readers
+FAISS_METADATA_DATA_PATH = "./embeddings/metadata.bin"
+FAISS_METADATA_OFFSETS_PATH = "./embeddings/metadata.offsets"
+# Pickled metadata from older versions, converted on first load
 FAISS_METADATA_PATH = "./embeddings/metadata.pkl"
+# Compression for large embedding indexes: "pq" (IVF-PQ), "sq8" (IVF with
+# int8 scalar quantization, higher recall), "hnsw" (uncompressed graph,
+# highest recall) or "none" to stay exact/flat
+FAISS_INDEX_QUANTIZER = os.getenv("FAISS_INDEX_QUANTIZER", "pq")
 
 # Model Configuration
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 LLM_MODEL = "llama2"  # Changed to a valid Ollama model name
+# Smaller model for cheap rewrites of cached answers
+FAST_LLM_MODEL = os.getenv("FAST_LLM_MODEL", "llama3.2:1b")
 
 # API Keys (Optional for real-time data)
 ALPHA_VANTAGE_API = os.getenv("ALPHA_VANTAGE_API")
@@ -1,32 +1,270 @@
 import os
+import math
+import asyncio
+import atexit
 import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from config import FAISS_INDEX_PATH, FAISS_METADATA_PATH, EMBEDDING_MODEL
+from config import (
+    FAISS_INDEX_PATH, FAISS_METADATA_PATH, FAISS_METADATA_DATA_PATH, FAISS_METADATA_OFFSETS_PATH,
+    EMBEDDING_MODEL, FAISS_INDEX_QUANTIZER
+)
+from embeddings.metadata_store import TextStore, encode_texts
 from utils.logger import log_event
 
+ENCODE_BATCH_SIZE = 64
+# Upper bound on chunks encoded at once, to cap embedding memory on large ingests
+ENCODE_CHUNK_SIZE = 4096
+# Bursts of inserts within this window are written to disk once
+PERSIST_DEBOUNCE_SECONDS = 2.0
+# Once the flat index holds this many vectors it is retrained as a compressed
+# IVF index (or an HNSW graph)
+IVFPQ_TRAIN_THRESHOLD = 50_000
+# IVF list count grows as 4 * sqrt(N), which keeps ~sqrt(N) / 4 training
+# points per list for k-means
+IVF_MAX_NLIST = 4096
+IVFPQ_SUBQUANTIZERS = 48
+IVFPQ_NBITS = 8
+# int8 codes hold more information per vector, so fewer lists suffice
+IVFSQ_NLIST_DIVISOR = 4
+IVF_NPROBE = 16
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Per-thread search buffers hold this many queries (and query x k results);
+# bigger searches get one-off arrays so a rare huge batch doesn't stay allocated
+SEARCH_BUFFER_MAX_QUERIES = 64
+SEARCH_BUFFER_MAX_ELEMENTS = SEARCH_BUFFER_MAX_QUERIES * 64
+# Larger indexes are searched on a GPU copy when faiss-gpu finds a device;
+# below this a CPU search is already faster than the kernel launch
+GPU_SEARCH_THRESHOLD = 50_000
+
+_gpu_resources = None
+
+def _atomic_write(path, data):
+    """Write bytes to a temp file and swap it in, so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def gpu_available():
+    """Whether faiss is the GPU build and sees at least one device."""
+    return hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0
+
+def index_to_gpu(index):
+    """Copy ``index`` to GPU 0 when faiss-gpu and a device are present, else return it."""
+    global _gpu_resources
+    if not gpu_available():
+        return index
+    try:
+        if _gpu_resources is None:
+            _gpu_resources = faiss.StandardGpuResources()
+        gpu_index = faiss.index_cpu_to_gpu(_gpu_resources, 0, index)
+        log_event(f"FAISS index moved to GPU ({type(index).__name__}).")
+        return gpu_index
+    except Exception as e:
+        # e.g. HNSW has no GPU implementation
+        log_event(f"Keeping FAISS index on CPU: {str(e)}", level="WARNING")
+        return index
+
+def read_index_mapped(path):
+    """Load a saved index read-only, with its codes mapped from the file where faiss can.
+
+    IO_FLAG_MMAP only maps IVF inverted lists; flat and HNSW storage is still
+    read into private memory. IO_FLAG_MMAP_IFC (newer faiss releases) maps
+    those too, so forked workers share one copy through the page cache.
+    """
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if flag is not None:
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            log_event(f"Cannot map FAISS index file: {str(e)}", level="WARNING")
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+@lru_cache(maxsize=2)
+def load_embedding_model(name=EMBEDDING_MODEL):
+    """Load a sentence-transformer once per process, set up for inference only."""
+    # Deferred: importing sentence_transformers pulls in torch
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(name)
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    if model.device.type == "cuda":
+        model.half()
+    log_event(f"Loaded embedding model {name} on {model.device}.")
+    return model
+
+def load_metadata(mmap=False):
+    """
+    Chunk texts aligned with the FAISS index rows.
+
+    Args:
+        mmap (bool): Return a read-only memory-mapped TextStore instead of a list
+
+    Returns:
+        list or TextStore: Texts, read from the legacy pickle if that is all there is
+    """
+    if os.path.exists(FAISS_METADATA_OFFSETS_PATH):
+        store = TextStore(FAISS_METADATA_DATA_PATH, FAISS_METADATA_OFFSETS_PATH)
+        if mmap:
+            return store
+        texts = list(store)
+        store.close()
+        return texts
+    with open(FAISS_METADATA_PATH, "rb") as f:
+        return pickle.load(f)
+
 class EmbeddingHandler:
     def __init__(self):
         """Initialize embedding model and FAISS index."""
         try:
             # Create embeddings directory if it doesn't exist
             os.makedirs(os.path.dirname(FAISS_INDEX_PATH), exist_ok=True)
+
+            # Index and metadata are persisted by a background thread
+            self._lock = threading.Lock()
+            self._persist_lock = threading.Lock()
+            # Held while the GPU copy is searched or grown in place; taken
+            # after _lock, never before it
+            self._gpu_lock = threading.Lock()
+            self._dirty = threading.Event()
+            threading.Thread(target=self._persist_loop, daemon=True).start()
+            atexit.register(self.flush)
+
+            # Searches from async callers run here instead of on the event loop.
+            # Each worker keeps FAISS single-threaded so concurrent queries use
+            # the pool for parallelism rather than oversubscribing OpenMP.
+            self._pool = ThreadPoolExecutor(
+                max_workers=os.cpu_count(),
+                thread_name_prefix="faiss-search",
+                initializer=faiss.omp_set_num_threads,
+                initargs=(1,)
+            )
             
-            self.model = SentenceTransformer(EMBEDDING_MODEL)
-            self.index = faiss.IndexFlatL2(self.model.get_sentence_embedding_dimension())
+            self.model = load_embedding_model(EMBEDDING_MODEL)
+            # Per-thread (1, dim) query buffers, reused across searches
+            self._local = threading.local()
+            # (index, copy searched in its place); self.index stays on the CPU
+            # since it is the one that is added to and saved. While a copy is
+            # uploading, _gpu_build is (index, rows added since the snapshot).
+            self._search_copy = None
+            self._gpu_build = None
+            # Inner product over L2-normalized vectors is cosine similarity
+            self.index = self._new_index()
             self.metadata = []
 
             # Load existing FAISS index if available
             if os.path.exists(FAISS_INDEX_PATH):
                 self.index = faiss.read_index(FAISS_INDEX_PATH)
-                with open(FAISS_METADATA_PATH, "rb") as f:
-                    self.metadata = pickle.load(f)
+                self.metadata = load_metadata()
+                if not os.path.exists(FAISS_METADATA_OFFSETS_PATH):
+                    self._dirty.set()  # rewrite legacy pickled metadata in the new format
                 log_event("FAISS index loaded successfully.")
+                self._configure_search()
+
+                if self.index.metric_type != faiss.METRIC_INNER_PRODUCT:
+                    self._rebuild_as_cosine()
         except Exception as e:
             log_event(f"Error initializing embedding handler: {str(e)}", level="ERROR")
             raise
 
+    def _new_index(self):
+        return faiss.IndexFlatIP(self.model.get_sentence_embedding_dimension())
+
+    def _configure_search(self):
+        if isinstance(self.index, faiss.IndexIVF):
+            self.index.nprobe = IVF_NPROBE
+        elif isinstance(self.index, faiss.IndexHNSW):
+            self.index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    def _new_compressed_index(self, d, n):
+        if FAISS_INDEX_QUANTIZER == "hnsw":
+            index = faiss.IndexHNSWFlat(d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            return index
+
+        nlist = min(IVF_MAX_NLIST, 4 * int(math.sqrt(n)))
+        quantizer = faiss.IndexFlatIP(d)
+        if FAISS_INDEX_QUANTIZER == "sq8":
+            return faiss.IndexIVFScalarQuantizer(
+                quantizer, d, max(1, nlist // IVFSQ_NLIST_DIVISOR),
+                faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+        # Sub-quantizer count must divide the dimension
+        m = max(i for i in range(1, IVFPQ_SUBQUANTIZERS + 1) if d % i == 0)
+        return faiss.IndexIVFPQ(
+            quantizer, d, nlist, m, IVFPQ_NBITS, faiss.METRIC_INNER_PRODUCT
+        )
+
+    def train(self):
+        """Replace the flat index with a compressed IVF index trained on its own vectors.
+
+        PQ (or int8 with ``FAISS_INDEX_QUANTIZER="sq8"``) codes take a fraction of
+        the float32 rows' bytes, and the inverted lists mean each query scans
+        only ``IVF_NPROBE`` of the index's lists. ``"hnsw"`` instead keeps the
+        float32 rows and links them in a graph searched in ~log(N) hops.
+        """
+        with self._lock:
+            if not isinstance(self.index, faiss.IndexFlat) or self.index.ntotal == 0:
+                return
+            vectors = self.index.reconstruct_n(0, self.index.ntotal)
+
+            index = self._new_compressed_index(self.index.d, len(vectors))
+            index.train(vectors)
+            index.add(vectors)
+            self.index = index
+            self._configure_search()
+        self._dirty.set()
+        log_event(f"Retrained FAISS index as {type(self.index).__name__} over {len(vectors)} vectors.")
+
+    def _rebuild_as_cosine(self):
+        """Re-embed an index saved with the old L2 metric into a cosine one."""
+        log_event("Rebuilding L2 FAISS index as normalized inner-product index.")
+        chunks = self.metadata
+        self.index = self._new_index()
+        self.metadata = []
+        if chunks:
+            self.add_to_index(chunks)
+
+    def _query_buffer(self):
+        """This thread's reusable float32 query buffer; asearch runs searches in parallel."""
+        buf = getattr(self._local, "query_buf", None)
+        if buf is None:
+            dim = self.model.get_sentence_embedding_dimension()
+            buf = self._local.query_buf = np.empty((1, dim), dtype=np.float32)
+        return buf
+
+    def _result_buffers(self, n, k):
+        """This thread's reusable (n, k) distance and id arrays for index.search."""
+        size = n * k
+        if size > SEARCH_BUFFER_MAX_ELEMENTS:
+            return np.empty((n, k), dtype=np.float32), np.empty((n, k), dtype=np.int64)
+        bufs = getattr(self._local, "result_bufs", None)
+        if bufs is None:
+            bufs = self._local.result_bufs = (
+                np.empty(SEARCH_BUFFER_MAX_ELEMENTS, dtype=np.float32),
+                np.empty(SEARCH_BUFFER_MAX_ELEMENTS, dtype=np.int64),
+            )
+        # Flat slices reshape to contiguous (n, k) views, as FAISS requires
+        return bufs[0][:size].reshape(n, k), bufs[1][:size].reshape(n, k)
+
+    def embedding_buffer(self, n):
+        """This thread's reusable (n, dim) float32 array, for stacking query embeddings."""
+        dim = self.model.get_sentence_embedding_dimension()
+        if n > SEARCH_BUFFER_MAX_QUERIES:
+            return np.empty((n, dim), dtype=np.float32)
+        buf = getattr(self._local, "embedding_buf", None)
+        if buf is None:
+            buf = self._local.embedding_buf = np.empty((SEARCH_BUFFER_MAX_QUERIES, dim), dtype=np.float32)
+        return buf[:n]
+
     def encode_text(self, text):
         """Convert text to embeddings."""
         return self.model.encode(text)
@@ -34,36 +272,213 @@ class EmbeddingHandler:
     def add_to_index(self, text_chunks):
         """Add new text chunks to FAISS index."""
         try:
-            embeddings = [self.encode_text(chunk) for chunk in text_chunks]
-            embeddings_array = np.array(embeddings).astype('float32')
-            self.index.add(embeddings_array)
-            self.metadata.extend(text_chunks)
-
-            # Save updated index and metadata
-            faiss.write_index(self.index, FAISS_INDEX_PATH)
-            with open(FAISS_METADATA_PATH, "wb") as f:
-                pickle.dump(self.metadata, f)
+            # Encode in bounded slices, each as one batched forward pass
+            for start in range(0, len(text_chunks), ENCODE_CHUNK_SIZE):
+                embeddings_array = self.model.encode(
+                    text_chunks[start:start + ENCODE_CHUNK_SIZE],
+                    batch_size=ENCODE_BATCH_SIZE,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                ).astype('float32', copy=False)
+                faiss.normalize_L2(embeddings_array)
+                with self._lock:
+                    self.index.add(embeddings_array)
+                    self._mirror_add(embeddings_array)
+                    self.metadata.extend(text_chunks[start:start + ENCODE_CHUNK_SIZE])
+
+            if (FAISS_INDEX_QUANTIZER != "none"
+                    and isinstance(self.index, faiss.IndexFlat)
+                    and self.index.ntotal >= IVFPQ_TRAIN_THRESHOLD):
+                self.train()
+
+            # Schedule a save of the updated index and metadata
+            self._dirty.set()
             log_event("New embeddings added to FAISS index.")
         except Exception as e:
             log_event(f"Error adding to index: {str(e)}", level="ERROR")
             raise
 
+    def _persist_loop(self):
+        """Background writer: wait for changes, debounce, then save."""
+        while True:
+            self._dirty.wait()
+            time.sleep(PERSIST_DEBOUNCE_SECONDS)
+            self._persist()
+
+    def _persist(self):
+        """Snapshot the index and metadata under the lock, then write them out."""
+        with self._persist_lock:
+            with self._lock:
+                if not self._dirty.is_set():
+                    return
+                self._dirty.clear()
+                index_bytes = faiss.serialize_index(self.index)
+                metadata = list(self.metadata)
+
+            try:
+                # Metadata only grows, so writing it before the index means a
+                # reader never sees index rows without their texts
+                data_bytes, offsets_bytes = encode_texts(metadata)
+                _atomic_write(FAISS_METADATA_DATA_PATH, data_bytes)
+                _atomic_write(FAISS_METADATA_OFFSETS_PATH, offsets_bytes)
+                _atomic_write(FAISS_INDEX_PATH, index_bytes)
+                log_event("FAISS index and metadata saved.")
+            except Exception as e:
+                self._dirty.set()
+                log_event(f"Error saving FAISS index: {str(e)}", level="ERROR")
+
+    def flush(self):
+        """Write pending index changes to disk immediately."""
+        self._persist()
+
+    def embed_query(self, query):
+        """Normalized (1, dim) float32 query embedding, owned by the caller."""
+        return self.model.encode(
+            [query],
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32, copy=False)
+
     def search(self, query, k=3):
         """Search for similar text chunks."""
         try:
-            query_embedding = self.encode_text(query)
-            query_embedding = np.array([query_embedding]).astype('float32')
-            distances, indices = self.index.search(query_embedding, k)
-            
-            results = []
-            for idx, dist in zip(indices[0], distances[0]):
-                if idx != -1:  # FAISS returns -1 for empty slots
-                    results.append((self.metadata[idx], float(dist)))
-            return results
+            query_embedding = self._query_buffer()
+            np.copyto(query_embedding[0], self.model.encode(
+                query,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ))
+            return self.search_embedding(query_embedding, k=k)
+        except Exception as e:
+            log_event(f"Error during search: {str(e)}", level="ERROR")
+            return []
+
+    def search_embedding(self, query_embedding, k=3):
+        """Search with an already normalized (1, dim) float32 query embedding."""
+        try:
+            return self._search_matrix(query_embedding, k)[0]
         except Exception as e:
             log_event(f"Error during search: {str(e)}", level="ERROR")
             return []
 
+    def _search_index(self):
+        """(index to search, whether it is the GPU copy): the copy once it holds over GPU_SEARCH_THRESHOLD vectors and is ready."""
+        index = self.index
+        copy = self._search_copy
+        if copy is not None and copy[0] is index:
+            return copy[1], copy[1] is not index
+        if index.ntotal > GPU_SEARCH_THRESHOLD:
+            self._start_gpu_copy(index)
+        return index, False
+
+    def _start_gpu_copy(self, index):
+        """Upload ``index`` to the GPU in the background; searches use the CPU index meanwhile."""
+        with self._lock:
+            if (self.index is not index
+                    or (self._gpu_build is not None and self._gpu_build[0] is index)
+                    or (self._search_copy is not None and self._search_copy[0] is index)):
+                return
+            if not gpu_available():
+                self._search_copy = (index, index)
+                return
+            # A memcpy-speed snapshot under the lock; the slow upload runs off it
+            snapshot = faiss.clone_index(index)
+            self._gpu_build = (index, [])
+        threading.Thread(
+            target=self._finish_gpu_copy, args=(index, snapshot), daemon=True, name="faiss-gpu-copy"
+        ).start()
+
+    def _finish_gpu_copy(self, index, snapshot):
+        try:
+            search_index = index_to_gpu(snapshot)
+        except Exception as e:
+            log_event(f"Keeping FAISS index on CPU: {str(e)}", level="WARNING")
+            search_index = snapshot
+        # Replay and install in the same critical section that ends the build,
+        # so no add_to_index can fall between the two and miss the copy
+        with self._lock:
+            build = self._gpu_build
+            if build is None or build[0] is not index:
+                return
+            self._gpu_build = None
+            if self.index is not index:
+                return  # retrained meanwhile; the next search starts over
+            if search_index is not snapshot:
+                try:
+                    for rows in build[1]:
+                        search_index.add(rows)
+                except Exception as e:
+                    log_event(f"Keeping FAISS index on CPU: {str(e)}", level="WARNING")
+                    search_index = snapshot
+            if search_index is snapshot:
+                # e.g. HNSW has no GPU version: keep searching the live index
+                search_index = index
+            self._search_copy = (index, search_index)
+
+    def _mirror_add(self, rows):
+        """Apply an add to the GPU copy (or pending upload) of self.index; caller holds the lock."""
+        copy = self._search_copy
+        if copy is not None and copy[0] is self.index and copy[1] is not copy[0]:
+            with self._gpu_lock:
+                copy[1].add(rows)
+        build = self._gpu_build
+        if build is not None and build[0] is self.index:
+            build[1].append(rows)
+
+    def _search_matrix(self, query_embeddings, k):
+        """One FAISS search over an (n, dim) query matrix; a result list per row."""
+        distances, indices = self._result_buffers(len(query_embeddings), k)
+        index, gpu = self._search_index()
+        if gpu:
+            # _mirror_add grows the GPU copy in place
+            with self._gpu_lock:
+                index.search(query_embeddings, k, D=distances, I=indices)
+        else:
+            index.search(query_embeddings, k, D=distances, I=indices)
+        metadata = self.metadata
+        return [
+            # FAISS returns -1 for empty slots
+            [(metadata[idx], dist) for idx, dist in zip(row_ids, row_dists) if idx != -1]
+            for row_ids, row_dists in zip(indices.tolist(), distances.tolist())
+        ]
+
+    def embed_queries(self, queries):
+        """Normalized (n, dim) float32 embeddings of several queries, in one batched encode."""
+        return self.model.encode(
+            list(queries),
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32, copy=False)
+
+    def search_embeddings(self, query_embeddings, k=3):
+        """Search with an already normalized (n, dim) float32 query matrix."""
+        try:
+            return self._search_matrix(query_embeddings, k)
+        except Exception as e:
+            log_event(f"Error during batch search: {str(e)}", level="ERROR")
+            return [[] for _ in range(len(query_embeddings))]
+
+    def search_batch(self, queries, k=3):
+        """Search for several queries with one batched encode and one FAISS search."""
+        if not queries:
+            return []
+        try:
+            query_embeddings = self.embed_queries(queries)
+        except Exception as e:
+            log_event(f"Error during batch search: {str(e)}", level="ERROR")
+            return [[] for _ in queries]
+        return self.search_embeddings(query_embeddings, k)
+
+    async def asearch(self, query, k=3):
+        """Search without blocking the event loop; encode and FAISS run in the pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self.search, query, k)
+
 if __name__ == "__main__":
     embedder = EmbeddingHandler()
     embedder.add_to_index(["Sample financial data"])
+    embedder.flush()
@@ -0,0 +1,53 @@
+import mmap
+import numpy as np
+
+def encode_texts(texts):
+    """
+    Serialize texts as a UTF-8 blob plus ``len(texts) + 1`` uint64 byte offsets.
+
+    Text ``i`` is ``blob[offsets[i]:offsets[i + 1]]``, the same layout as the
+    API's DocumentStore.
+
+    Returns:
+        tuple: (blob bytes, offsets bytes)
+    """
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(blob) for blob in encoded], dtype=np.uint64, out=offsets[1:])
+    return b"".join(encoded), offsets.tobytes()
+
+class TextStore:
+    """
+    Read-only, memory-mapped view over files written from ``encode_texts``.
+
+    Texts are decoded on access, and processes opening the same files share
+    one copy through the page cache.
+    """
+
+    def __init__(self, data_path, offsets_path):
+        self._offsets = np.memmap(offsets_path, dtype=np.uint64, mode="r")
+        self._mm = None
+        if int(self._offsets[-1]) > 0:
+            with open(data_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._offsets = np.zeros(1, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("text index out of range")
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return self._mm[start:end].decode("utf-8") if end > start else ""
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
@@ -1,14 +1,46 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
+import atexit
+import queue
 import threading
+import time
+from collections import defaultdict
+from cachetools import LRUCache
 from llm.llm_interface import LLMInterface
 from enhancements.hybrid_search.hybrid_retriever import HybridRetriever
-from enhancements.data_integration.market_data import MarketDataEnricher
-from enhancements.portfolio.portfolio_manager import PortfolioManager
+from enhancements.data_integration.market_data import MarketDataEnricher, format_timestamp
+from enhancements.portfolio.portfolio_manager import PortfolioManager, warmup_kernels
+from enhancements.cache.semantic_cache import SemanticCache, ANALYSIS_CACHE_PATH
 from utils.logger import log_event
-import json
+import orjson
 import os
 
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for request parsing and jsonify()."""
+
+    option = orjson.OPT_NON_STR_KEYS
+
+    @staticmethod
+    def _default(obj):
+        # Types orjson does not handle natively (e.g. Decimal) fall back to str()
+        return str(obj)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self._default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes to the response directly instead of round-tripping via str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self._default, option=self.option),
+            mimetype="application/json"
+        )
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # Create data directories if they don't exist
 os.makedirs(os.path.join("data", "portfolios"), exist_ok=True)
@@ -17,9 +49,34 @@ os.makedirs(os.path.join("data", "analytics"), exist_ok=True)
 # Initialize services
 llm_interface = LLMInterface()
 market_data = MarketDataEnricher()
+response_cache = SemanticCache()
+# Analyses share one prompt template, so they get their own cache rather
+# than competing with /query answers for nearest() matches and LRU slots
+analysis_cache = SemanticCache(path=ANALYSIS_CACHE_PATH)
+# JIT compilation happens at startup, not in the first portfolio request
+warmup_kernels()
+# Similarity above which a cached analysis is adapted rather than regenerated
+NEAR_MISS_THRESHOLD = 0.80
+
+class SessionCache(LRUCache):
+    """LRU of user PortfolioManagers that flushes a session before evicting it."""
+
+    def popitem(self):
+        user_id, session = super().popitem()
+        session.flush()
+        return user_id, session
 
-# Store active user sessions
-user_sessions = {}
+# Store active user sessions, bounded so idle users are eventually dropped
+user_sessions = SessionCache(maxsize=int(os.getenv("SESSION_CACHE_SIZE", 10000)))
+_sessions_lock = threading.RLock()
+
+def _get_session(user_id):
+    """Return the user's PortfolioManager, creating it at most once under concurrency."""
+    with _sessions_lock:
+        session = user_sessions.get(user_id)
+        if session is None:
+            session = user_sessions[user_id] = PortfolioManager(user_id)
+        return session
 
 @app.route('/api/v1/query', methods=['POST'])
 def query_endpoint():
@@ -46,10 +103,15 @@ def query_endpoint():
         personalize = data.get('personalize', False)
         
         # Log the request
-        log_event(f"API request: {json.dumps(data)}")
+        log_event("API request: %s", data, level="DEBUG")
         
-        # Generate base response
-        base_response = llm_interface.generate_response(query)
+        # Generate base response, reusing the answer to the same or a similar query
+        base_response = response_cache.get(query)
+        if base_response is None:
+            base_response, generated = llm_interface.generate_response_with_status(query)
+            # Errors and fallbacks would otherwise be served to similar queries too
+            if generated:
+                response_cache.put(query, base_response)
         
         # Enhanced response pipeline
         enhanced_response = base_response
@@ -60,11 +122,7 @@ def query_endpoint():
         
         # Personalize if requested and user_id provided
         if personalize and user_id:
-            # Check if we already have a session for this user
-            if user_id not in user_sessions:
-                user_sessions[user_id] = PortfolioManager(user_id)
-                
-            enhanced_response = user_sessions[user_id].personalize_response(query, enhanced_response)
+            enhanced_response = _get_session(user_id).personalize_response(query, enhanced_response)
         
         # Track query for analytics
         if user_id:
@@ -81,6 +139,81 @@ def query_endpoint():
         log_event(f"API error: {str(e)}", level="ERROR")
         return jsonify({"error": str(e)}), 500
 
+def _sse(payload):
+    """Encode one server-sent event carrying a JSON payload."""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+def _relay_tokens(stream, tokens):
+    """Yield ``stream``'s pieces as token events, collecting them in ``tokens``; return its return value."""
+    while True:
+        try:
+            token = next(stream)
+        except StopIteration as stop:
+            return stop.value
+        tokens.append(token)
+        yield _sse({"token": token})
+
+@app.route('/api/v1/query_stream', methods=['POST'])
+def query_stream_endpoint():
+    """
+    Streaming variant of /api/v1/query using server-sent events.
+    
+    Accepts the same request body. Each event's data is a JSON object:
+    {"token": "..."} pieces of the answer as they are generated, then a
+    final {"done": true, "response": "...", ...} carrying the complete,
+    enriched and personalized response.
+    """
+    data = request.json
+    
+    if not data or 'query' not in data:
+        return jsonify({"error": "Missing 'query' parameter"}), 400
+        
+    query = data['query']
+    user_id = data.get('user_id')
+    enrich = data.get('enrich_with_market_data', False)
+    personalize = data.get('personalize', False)
+    
+    log_event("API stream request: %s", data, level="DEBUG")
+    
+    def generate():
+        try:
+            base_response = response_cache.get(query)
+            if base_response is not None:
+                yield _sse({"token": base_response})
+            else:
+                tokens = []
+                generated = yield from _relay_tokens(llm_interface.generate_response_stream(query), tokens)
+                base_response = "".join(tokens)
+                if generated:
+                    response_cache.put(query, base_response)
+            
+            # Enrichment and personalization need the whole answer
+            enhanced_response = base_response
+            if enrich:
+                enhanced_response = market_data.enrich_response(query, enhanced_response)
+            if personalize and user_id:
+                enhanced_response = _get_session(user_id).personalize_response(query, enhanced_response)
+            
+            if user_id:
+                track_query_analytics(user_id, query, len(enhanced_response))
+            
+            yield _sse({
+                "done": True,
+                "query": query,
+                "response": enhanced_response,
+                "enriched": enrich,
+                "personalized": personalize and user_id is not None
+            })
+        except Exception as e:
+            log_event(f"API stream error: {str(e)}", level="ERROR")
+            yield _sse({"done": True, "error": str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route('/api/v1/portfolio', methods=['GET', 'POST', 'PUT'])
 def portfolio_endpoint():
     """
@@ -99,10 +232,7 @@ def portfolio_endpoint():
         user_id = data['user_id']
         
         # Initialize portfolio manager if needed
-        if user_id not in user_sessions:
-            user_sessions[user_id] = PortfolioManager(user_id)
-        
-        portfolio_manager = user_sessions[user_id]
+        portfolio_manager = _get_session(user_id)
         
         if request.method == 'GET':
             # Get portfolio summary
@@ -119,10 +249,12 @@ def portfolio_endpoint():
             
             for holding in holdings:
                 if all(k in holding for k in ['symbol', 'quantity', 'purchase_price']):
+                    # Written to disk once for the whole batch below
                     success = portfolio_manager.add_holding(
                         holding['symbol'],
                         holding['quantity'],
-                        holding['purchase_price']
+                        holding['purchase_price'],
+                        save=False
                     )
                     results.append({
                         "symbol": holding['symbol'],
@@ -135,6 +267,10 @@ def portfolio_endpoint():
                         "error": "Missing required fields"
                     })
             
+            if not portfolio_manager.flush():
+                for result in results:
+                    result["success"] = False
+            
             return jsonify({"results": results})
             
         elif request.method == 'PUT':
@@ -167,14 +303,11 @@ def market_data_endpoint():
         
         response = {
             "data": {},
-            "timestamp": market_data.fetch_live_data({"symbols": []})["timestamp"]
+            "timestamp": format_timestamp()
         }
         
-        # Get data for each symbol
-        for symbol in symbols:
-            stock_data = market_data.fetch_stock_data(symbol)
-            if stock_data:
-                response["data"][symbol] = stock_data
+        # Get data for every symbol concurrently
+        response["data"] = market_data.fetch_stocks(symbols)
         
         # Get news if requested
         if include_news:
@@ -239,8 +372,26 @@ def analyze_investment():
         5. Allocation recommendations
         """
         
-        # Generate analysis
-        analysis = llm_interface.generate_response(prompt)
+        # Generate analysis. Prompts for different symbols share the template,
+        # so a similar cached analysis is never returned as-is; it is rewritten
+        # for the new parameters by the fast model instead.
+        analysis = analysis_cache.get(prompt, semantic=False)
+        if analysis is None:
+            # Embedded once for both the near-miss probe and the store
+            vector = analysis_cache.embed(prompt)
+            match = analysis_cache.nearest(prompt, vector)
+            if match is not None and match[0] >= NEAR_MISS_THRESHOLD:
+                rewrite_prompt = (
+                    f"Adapt the following {investment_type} investment analysis to these new "
+                    f"parameters: {orjson.dumps(parameters).decode()}, investor risk profile: {risk_profile}. "
+                    f"Keep the same structure.\n\n{match[2]}"
+                )
+                analysis = llm_interface.generate_response_fast(rewrite_prompt)
+            generated = analysis is not None
+            if analysis is None:
+                analysis, generated = llm_interface.generate_response_with_status(prompt)
+            if generated:
+                analysis_cache.put(prompt, analysis, vector)
         
         # Enhance with market data
         if "symbol" in parameters:
@@ -250,17 +401,17 @@ def analyze_investment():
         
         # Personalize if user_id provided
         if user_id:
-            if user_id not in user_sessions:
-                user_sessions[user_id] = PortfolioManager(user_id)
+            portfolio_manager = _get_session(user_id)
                 
             # Check if personalization is relevant
             if "parameters" in data and "symbol" in parameters:
                 # Check if symbol is in portfolio
-                for holding in user_sessions[user_id].portfolio["holdings"]:
+                for holding in portfolio_manager.portfolio["holdings"]:
                     if holding["symbol"] == parameters["symbol"]:
                         # Personalize the analysis
-                        portfolio_context = user_sessions[user_id].get_portfolio_context()
-                        analysis = user_sessions[user_id].contextualize_response(analysis, portfolio_context)
+                        summary = portfolio_manager.get_portfolio_summary()
+                        portfolio_context = portfolio_manager.get_portfolio_context(summary)
+                        analysis = portfolio_manager.contextualize_response(analysis, portfolio_context, summary)
                         break
         
         return jsonify({
@@ -273,21 +424,65 @@ def analyze_investment():
         log_event(f"Investment analysis API error: {str(e)}", level="ERROR")
         return jsonify({"error": str(e)}), 500
 
+# Analytics entries are queued on the request path and written in batches
+ANALYTICS_FLUSH_SECONDS = 2.0
+ANALYTICS_BATCH_SIZE = 500
+_analytics_queue = queue.Queue()
+
+def _write_analytics(batch):
+    """Append a batch of (user_id, entry) pairs, opening each user's file once."""
+    lines_by_user = defaultdict(list)
+    for user_id, entry in batch:
+        lines_by_user[user_id].append(orjson.dumps(entry) + b'\n')
+    
+    analytics_dir = os.path.join("data", "analytics")
+    os.makedirs(analytics_dir, exist_ok=True)
+    for user_id, lines in lines_by_user.items():
+        try:
+            analytics_file = os.path.join(analytics_dir, f"{user_id}_queries.jsonl")
+            with open(analytics_file, 'ab', buffering=64 * 1024) as f:
+                f.writelines(lines)
+        except Exception as e:
+            log_event(f"Error tracking analytics: {str(e)}", level="WARNING")
+
+def _drain_analytics(batch, deadline=None):
+    """Move queued entries into ``batch`` until it is full or ``deadline`` passes."""
+    while len(batch) < ANALYTICS_BATCH_SIZE:
+        try:
+            if deadline is None:
+                batch.append(_analytics_queue.get_nowait())
+            else:
+                batch.append(_analytics_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            break
+    return batch
+
+def _analytics_flusher():
+    """Wait for an entry, gather more for up to ANALYTICS_FLUSH_SECONDS, then write."""
+    while True:
+        batch = [_analytics_queue.get()]
+        _drain_analytics(batch, time.monotonic() + ANALYTICS_FLUSH_SECONDS)
+        _write_analytics(batch)
+
+def _flush_analytics_at_exit():
+    while True:
+        batch = _drain_analytics([])
+        if not batch:
+            break
+        _write_analytics(batch)
+
+threading.Thread(target=_analytics_flusher, daemon=True).start()
+atexit.register(_flush_analytics_at_exit)
+
 def track_query_analytics(user_id, query, response_length):
     """Track query for analytics purposes."""
     try:
-        analytics_dir = os.path.join("data", "analytics")
-        os.makedirs(analytics_dir, exist_ok=True)
-        
-        analytics_file = os.path.join(analytics_dir, f"{user_id}_queries.jsonl")
-        
-        with open(analytics_file, 'a') as f:
-            entry = {
-                "timestamp": market_data.fetch_live_data({"symbols": []})["timestamp"],
-                "query": query,
-                "response_length": response_length
-            }
-            f.write(json.dumps(entry) + '\n')
+        entry = {
+            "timestamp": format_timestamp(),
+            "query": query,
+            "response_length": response_length
+        }
+        _analytics_queue.put((user_id, entry))
     except Exception as e:
         log_event(f"Error tracking analytics: {str(e)}", level="WARNING")
 
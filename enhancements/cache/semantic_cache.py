@@ -0,0 +1,181 @@
+import os
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import orjson
+from embeddings.embedding import load_embedding_model
+from utils.logger import log_event
+
+DEFAULT_CACHE_PATH = os.path.join("data", "cache", "semantic.jsonl")
+ANALYSIS_CACHE_PATH = os.path.join("data", "cache", "analysis.jsonl")
+
+class SemanticCache:
+    """
+    Two-tier LLM response cache: exact prompt matches first, then the most
+    similar cached prompt by cosine similarity of sentence embeddings.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=10000, path=DEFAULT_CACHE_PATH, model=None):
+        """Initialize an empty cache and reload any entries persisted at ``path``."""
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.model = model or load_embedding_model()
+        self._lock = threading.Lock()
+
+        # Exact tier: prompt hash -> slot, kept in LRU order (oldest first)
+        self._slots = OrderedDict()
+        # Semantic tier: one row per slot of L2-normalized prompt embeddings;
+        # a matrix-vector product over it is a flat inner-product scan
+        dim = self.model.get_sentence_embedding_dimension()
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._keys = [None] * max_entries
+        self._prompts = [None] * max_entries
+        self._responses = [None] * max_entries
+
+        self.load()
+        atexit.register(self.save)
+
+    @staticmethod
+    def _key(prompt):
+        return hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _embed(self, prompts):
+        return self.model.encode(
+            prompts,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32, copy=False)
+
+    def embed(self, prompt):
+        """Normalized embedding of ``prompt``, reusable by ``nearest`` and ``put``."""
+        return self._embed([prompt])[0]
+
+    def get(self, prompt, semantic=True):
+        """
+        Look up a cached response.
+
+        Args:
+            prompt (str): Prompt or query sent to the LLM
+            semantic (bool): Fall back to similar prompts when there is no exact match
+
+        Returns:
+            str or None: Cached response, if any
+        """
+        key = self._key(prompt)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._slots.move_to_end(key)
+                return self._responses[slot]
+            if not semantic or not self._slots:
+                return None
+
+        query = self._embed([prompt])[0]
+        with self._lock:
+            scores = self._vectors @ query
+            scores[~self._valid] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                return None
+            self._slots.move_to_end(self._keys[slot])
+            log_event("Semantic cache hit (similarity: %.4f)", scores[slot])
+            return self._responses[slot]
+
+    def nearest(self, prompt, vector=None):
+        """
+        Find the most similar cached prompt regardless of threshold.
+
+        Args:
+            prompt (str): Prompt or query sent to the LLM
+            vector (np.ndarray): Precomputed ``embed(prompt)``, if any
+
+        Returns:
+            tuple or None: (similarity, cached_prompt, cached_response)
+        """
+        query = self.embed(prompt) if vector is None else vector
+        with self._lock:
+            if not self._slots:
+                return None
+            scores = self._vectors @ query
+            scores[~self._valid] = -np.inf
+            slot = int(np.argmax(scores))
+            return float(scores[slot]), self._prompts[slot], self._responses[slot]
+
+    def put(self, prompt, response, vector=None):
+        """Cache a response, evicting the least recently used entry when full."""
+        self.put_many([(prompt, response)], None if vector is None else [vector])
+
+    def put_many(self, items, vectors=None):
+        """
+        Cache several (prompt, response) pairs with a single embedding batch.
+
+        ``vectors``, when given, holds one precomputed ``embed(prompt)`` per
+        item, so prompts already embedded by ``nearest`` are not encoded again.
+        """
+        items = [(self._key(prompt), prompt, response) for prompt, response in items]
+        with self._lock:
+            new_items = []
+            new_vectors = []
+            for i, (key, prompt, response) in enumerate(items):
+                slot = self._slots.get(key)
+                if slot is None:
+                    new_items.append((key, prompt, response))
+                    if vectors is not None:
+                        new_vectors.append(vectors[i])
+                else:
+                    self._responses[slot] = response
+                    self._slots.move_to_end(key)
+        if not new_items:
+            return
+
+        if vectors is None:
+            vectors = self._embed([prompt for _, prompt, _ in new_items])
+        else:
+            vectors = new_vectors
+        with self._lock:
+            for (key, prompt, response), vector in zip(new_items, vectors):
+                if key in self._slots:
+                    continue
+                if len(self._slots) < self.max_entries:
+                    slot = int(np.argmin(self._valid))
+                else:
+                    _, slot = self._slots.popitem(last=False)
+                self._vectors[slot] = vector
+                self._valid[slot] = True
+                self._keys[slot] = key
+                self._prompts[slot] = prompt
+                self._responses[slot] = response
+                self._slots[key] = slot
+
+    def save(self):
+        """Write entries to ``path`` as JSON lines, least recently used first."""
+        try:
+            with self._lock:
+                lines = [
+                    orjson.dumps({"prompt": self._prompts[slot], "response": self._responses[slot]})
+                    for slot in self._slots.values()
+                ]
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(b"\n".join(lines))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            log_event(f"Error saving semantic cache: {str(e)}", level="WARNING")
+
+    def load(self):
+        """Re-embed entries persisted by ``save`` in one batch."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                entries = [orjson.loads(line) for line in f if line.strip()]
+            self.put_many((entry["prompt"], entry["response"]) for entry in entries[-self.max_entries:])
+            log_event(f"Loaded {len(self._slots)} semantic cache entries")
+        except Exception as e:
+            log_event(f"Error loading semantic cache: {str(e)}", level="WARNING")
@@ -1,11 +1,86 @@
 import os
 import requests
-import json
 import datetime
 import re
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+
+try:
+    import ahocorasick
+except ImportError:  # fall back to one substring test per keyword
+    ahocorasick = None
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from utils.logger import log_event
 from config import ALPHA_VANTAGE_API
 
+ALPHA_VANTAGE_ENDPOINT = "https://www.alphavantage.co/query"
+REQUEST_TIMEOUT_SECONDS = 5
+# How long a fetched quote / news list is served from memory
+QUOTE_TTL_SECONDS = 60
+NEWS_TTL_SECONDS = 300
+
+# Entity extraction vocabulary, built once at import
+_SYMBOL_RE = re.compile(r'\b[A-Z]{1,5}\b')
+# Common words that match the symbol pattern
+_COMMON_WORDS = frozenset({'I', 'A', 'THE', 'TO', 'IN', 'IS', 'IT', 'AND', 'OR', 'FOR'})
+_METRIC_KEYWORDS = (
+    "price", "return", "dividend", "yield", "eps", "p/e", "market cap",
+    "volume", "revenue", "profit", "growth", "performance", "trend"
+)
+_ASSET_CLASSES = ("stock", "bond", "etf", "forex", "crypto", "commodity", "index")
+_KEYWORD_TABLES = {"metrics": _METRIC_KEYWORDS, "asset_classes": _ASSET_CLASSES}
+# Matches every query the full extractor could find an entity in (and a few
+# more, e.g. a lone "I"), so a miss means there is nothing to enrich
+_ENTITY_PREFILTER = re.compile(
+    _SYMBOL_RE.pattern
+    + "|(?i:" + "|".join(re.escape(kw) for kw in _METRIC_KEYWORDS + _ASSET_CLASSES) + ")"
+)
+
+def _build_keyword_automaton():
+    """One Aho-Corasick automaton over every keyword, tagged (kind, position, keyword)."""
+    automaton = ahocorasick.Automaton()
+    for kind, keywords in _KEYWORD_TABLES.items():
+        for position, keyword in enumerate(keywords):
+            automaton.add_word(keyword, (kind, position, keyword))
+    automaton.make_automaton()
+    return automaton
+
+_KEYWORD_AUTOMATON = _build_keyword_automaton() if ahocorasick else None
+
+def _match_keywords(query_lower):
+    """Keywords of each kind found in the query, in table order."""
+    if _KEYWORD_AUTOMATON is None:
+        return {
+            kind: [keyword for keyword in keywords if keyword in query_lower]
+            for kind, keywords in _KEYWORD_TABLES.items()
+        }
+    # Single pass over the query; overlapping matches are all reported
+    found = {kind: {} for kind in _KEYWORD_TABLES}
+    for _, (kind, position, keyword) in _KEYWORD_AUTOMATON.iter(query_lower):
+        found[kind][position] = keyword
+    return {kind: [hits[p] for p in sorted(hits)] for kind, hits in found.items()}
+
+def format_timestamp():
+    """Current local time in the format used across market data payloads."""
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+# Shared by every enricher so quote and news requests run concurrently;
+# sized to the HTTP connection pool so every worker can hold a connection
+_fetch_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="market-data")
+
+# Keep-alive connections to Alpha Vantage, shared by every enricher (the API
+# creates one per user session) and reused across threads. Connection errors
+# and 5xx answers are retried with a short backoff.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504))
+))
+
 class MarketDataEnricher:
     """
     Enriches RAG responses with real-time market data from financial APIs.
@@ -16,6 +91,12 @@ class MarketDataEnricher:
         self.api_key = api_key or ALPHA_VANTAGE_API or os.getenv("ALPHA_VANTAGE_API")
         if not self.api_key:
             log_event("No API key found for financial data. Real-time enrichment will be limited.", level="WARNING")
+
+        # Successful responses only; failures are retried on the next request.
+        # TTLCache is not thread-safe and Flask serves requests from threads.
+        self._quote_cache = TTLCache(maxsize=1024, ttl=QUOTE_TTL_SECONDS)
+        self._news_cache = TTLCache(maxsize=64, ttl=NEWS_TTL_SECONDS)
+        self._cache_lock = threading.Lock()
     
     def extract_financial_entities(self, query):
         """
@@ -33,31 +114,75 @@ class MarketDataEnricher:
             "asset_classes": []
         }
         
-        # Extract stock symbols (simple regex for demonstration)
-        symbol_pattern = r'\b[A-Z]{1,5}\b'
-        potential_symbols = re.findall(symbol_pattern, query)
-        
-        # Filter out common words that match the pattern
-        common_words = {'I', 'A', 'THE', 'TO', 'IN', 'IS', 'IT', 'AND', 'OR', 'FOR'}
-        symbols = [sym for sym in potential_symbols if sym not in common_words]
+        # Extract stock symbols (simple regex for demonstration), skipping common words
+        symbols = [sym for sym in _SYMBOL_RE.findall(query) if sym not in _COMMON_WORDS]
         
         # Only include the first few symbols to avoid unnecessary API calls
         entities["symbols"] = symbols[:3]
         
-        # Extract financial metrics
-        metric_keywords = [
-            "price", "return", "dividend", "yield", "eps", "p/e", "market cap", 
-            "volume", "revenue", "profit", "growth", "performance", "trend"
-        ]
-        entities["metrics"] = [metric for metric in metric_keywords if metric.lower() in query.lower()]
-        
-        # Extract asset classes
-        asset_classes = ["stock", "bond", "etf", "forex", "crypto", "commodity", "index"]
-        entities["asset_classes"] = [asset for asset in asset_classes if asset.lower() in query.lower()]
+        # Extract financial metrics and asset classes
+        entities.update(_match_keywords(query.lower()))
         
-        log_event(f"Extracted financial entities: {entities}")
+        log_event("Extracted financial entities: %s", entities)
         return entities
     
+    def _cached_quote(self, symbol):
+        with self._cache_lock:
+            return self._quote_cache.get(symbol)
+
+    def _quote_params(self, symbol):
+        return {
+            "function": "GLOBAL_QUOTE",
+            "symbol": symbol,
+            "apikey": self.api_key
+        }
+
+    def _parse_quote(self, symbol, data):
+        """Build and cache the quote dict from a GLOBAL_QUOTE payload."""
+        if "Global Quote" in data and data["Global Quote"]:
+            quote = {
+                "symbol": symbol,
+                "price": data["Global Quote"].get("05. price"),
+                "change": data["Global Quote"].get("09. change"),
+                "change_percent": data["Global Quote"].get("10. change percent"),
+                "volume": data["Global Quote"].get("06. volume"),
+                "timestamp": format_timestamp()
+            }
+            with self._cache_lock:
+                self._quote_cache[symbol] = quote
+            return quote
+        else:
+            log_event(f"No data found for symbol {symbol}", level="WARNING")
+            return None
+
+    def _cached_news(self, topic):
+        with self._cache_lock:
+            return self._news_cache.get(topic)
+
+    def _news_params(self, topic):
+        return {
+            "function": "NEWS_SENTIMENT",
+            "topics": topic,
+            "apikey": self.api_key,
+            "limit": 3  # Limit to 3 news items
+        }
+
+    def _parse_news(self, topic, data):
+        """Build and cache the news list from a NEWS_SENTIMENT payload."""
+        if "feed" in data:
+            news = [{
+                "title": item.get("title"),
+                "summary": item.get("summary"),
+                "url": item.get("url"),
+                "published": item.get("time_published")
+            } for item in data["feed"][:3]]
+            with self._cache_lock:
+                self._news_cache[topic] = news
+            return news
+        else:
+            log_event("No market news found", level="WARNING")
+            return []
+
     def fetch_stock_data(self, symbol):
         """
         Fetch real-time stock data for a given symbol.
@@ -71,31 +196,16 @@ class MarketDataEnricher:
         if not self.api_key:
             log_event(f"Cannot fetch data for {symbol}: No API key", level="WARNING")
             return None
+
+        cached = self._cached_quote(symbol)
+        if cached is not None:
+            return cached
             
         try:
-            endpoint = f"https://www.alphavantage.co/query"
-            params = {
-                "function": "GLOBAL_QUOTE",
-                "symbol": symbol,
-                "apikey": self.api_key
-            }
-            
-            response = requests.get(endpoint, params=params)
-            data = response.json()
-            
-            if "Global Quote" in data and data["Global Quote"]:
-                return {
-                    "symbol": symbol,
-                    "price": data["Global Quote"].get("05. price"),
-                    "change": data["Global Quote"].get("09. change"),
-                    "change_percent": data["Global Quote"].get("10. change percent"),
-                    "volume": data["Global Quote"].get("06. volume"),
-                    "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-            else:
-                log_event(f"No data found for symbol {symbol}", level="WARNING")
-                return None
-                
+            response = _SESSION.get(
+                ALPHA_VANTAGE_ENDPOINT, params=self._quote_params(symbol), timeout=REQUEST_TIMEOUT_SECONDS
+            )
+            return self._parse_quote(symbol, orjson.loads(response.content))
         except Exception as e:
             log_event(f"Error fetching stock data for {symbol}: {str(e)}", level="ERROR")
             return None
@@ -113,34 +223,47 @@ class MarketDataEnricher:
         if not self.api_key:
             log_event("Cannot fetch market news: No API key", level="WARNING")
             return []
+
+        topic = topic or "financial_markets"
+        cached = self._cached_news(topic)
+        if cached is not None:
+            return cached
             
         try:
-            endpoint = f"https://www.alphavantage.co/query"
-            params = {
-                "function": "NEWS_SENTIMENT",
-                "topics": topic or "financial_markets",
-                "apikey": self.api_key,
-                "limit": 3  # Limit to 3 news items
-            }
-            
-            response = requests.get(endpoint, params=params)
-            data = response.json()
-            
-            if "feed" in data:
-                return [{
-                    "title": item.get("title"),
-                    "summary": item.get("summary"),
-                    "url": item.get("url"),
-                    "published": item.get("time_published")
-                } for item in data["feed"][:3]]
-            else:
-                log_event("No market news found", level="WARNING")
-                return []
-                
+            response = _SESSION.get(
+                ALPHA_VANTAGE_ENDPOINT, params=self._news_params(topic), timeout=REQUEST_TIMEOUT_SECONDS
+            )
+            return self._parse_news(topic, orjson.loads(response.content))
         except Exception as e:
             log_event(f"Error fetching market news: {str(e)}", level="ERROR")
             return []
     
+    def fetch_stocks(self, symbols):
+        """
+        Fetch quotes for several symbols concurrently.
+        
+        Args:
+            symbols (list): Stock ticker symbols
+            
+        Returns:
+            dict: Stock data keyed by symbol, omitting unavailable symbols
+        """
+        # Fresh cached quotes are served inline; only the misses are fetched,
+        # and a single miss skips the thread hand-off
+        quotes, missing = {}, []
+        for symbol in dict.fromkeys(symbols):
+            cached = self._cached_quote(symbol) if self.api_key else None
+            if cached is not None:
+                quotes[symbol] = cached
+            else:
+                missing.append(symbol)
+        
+        if len(missing) == 1:
+            quotes[missing[0]] = self.fetch_stock_data(missing[0])
+        elif missing:
+            quotes.update(zip(missing, _fetch_pool.map(self.fetch_stock_data, missing)))
+        return {symbol: quotes[symbol] for symbol in dict.fromkeys(symbols) if quotes[symbol]}
+    
     def fetch_live_data(self, entities):
         """
         Fetch all relevant live data based on extracted entities.
@@ -154,22 +277,28 @@ class MarketDataEnricher:
         data = {
             "stocks": {},
             "news": [],
-            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "timestamp": format_timestamp()
         }
         
+        symbols = entities.get("symbols", [])
+        # Get news related to first asset class or general financial news
+        topic = (entities.get("asset_classes") or ["financial_markets"])[0]
+        
+        # When news is known to be needed up front, fetch it alongside the quotes
+        news_future = None
+        if "news" in entities.get("metrics", []) or not symbols:
+            news_future = _fetch_pool.submit(self.fetch_market_news, topic)
+        
         # Fetch stock data for each symbol
-        for symbol in entities.get("symbols", []):
-            stock_data = self.fetch_stock_data(symbol)
-            if stock_data:
-                data["stocks"][symbol] = stock_data
-        
-        # Fetch relevant news if requested
-        if "news" in entities.get("metrics", []) or not data["stocks"]:
-            # Get news related to first asset class or general financial news
-            topic = entities.get("asset_classes", ["financial_markets"])[0]
+        data["stocks"] = self.fetch_stocks(symbols)
+        
+        # Fetch relevant news if requested, or as a fallback when no quotes came back
+        if news_future is not None:
+            data["news"] = news_future.result()
+        elif not data["stocks"]:
             data["news"] = self.fetch_market_news(topic)
         
-        log_event(f"Fetched live data: {json.dumps(data, default=str)[:200]}...")
+        log_event("Fetched live data: %.200s...", data)
         return data
     
     def merge_knowledge_with_live_data(self, base_response, live_data):
@@ -220,6 +349,10 @@ class MarketDataEnricher:
             str: Enriched response
         """
         try:
+            # One regex scan rules out queries with no possible entities
+            if not _ENTITY_PREFILTER.search(query):
+                return base_response
+            
             # Extract entities from query
             entities = self.extract_financial_entities(query)
             
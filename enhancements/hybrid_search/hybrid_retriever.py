@@ -1,9 +1,16 @@
+from functools import lru_cache
+from operator import itemgetter
 import numpy as np
-from rank_bm25 import BM25Okapi
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-from embeddings.embedding import EmbeddingHandler
+from retrieval.retriever import FinanceRetriever
 from utils.logger import log_event
 
+# BM25Okapi parameters, matching rank_bm25's defaults
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
 class HybridRetriever:
     """
     Implements a hybrid retrieval system combining dense embeddings (FAISS) with 
@@ -12,9 +19,12 @@ class HybridRetriever:
     
     def __init__(self, embedding_handler=None):
         """Initialize hybrid retriever with both vector and sparse search capabilities."""
-        self.embedding_handler = embedding_handler or EmbeddingHandler()
-        self.bm25 = None
+        # Share the process-wide retriever's index rather than loading another copy
+        self.embedding_handler = embedding_handler or FinanceRetriever.instance().embedder
         self.corpus = None
+        self._vocab = {}
+        # Query -> (embedding, term ids), so follow-ups skip re-embedding
+        self._q_cache = lru_cache(maxsize=512)(self._prepare_query)
         self.initialize_sparse_index()
         log_event("Hybrid retriever initialized with dense and sparse capabilities")
     
@@ -24,33 +34,83 @@ class HybridRetriever:
             # Use the same corpus as the FAISS index
             self.corpus = self.embedding_handler.metadata
             
-            # Tokenize documents
+            # Tokenize documents and intern tokens as integer term ids
             tokenized_corpus = [doc.lower().split() for doc in self.corpus]
+            n_docs = len(tokenized_corpus)
+            self._vocab = {}
+            term_ids = np.fromiter(
+                (self._vocab.setdefault(token, len(self._vocab))
+                 for doc in tokenized_corpus for token in doc),
+                dtype=np.int64
+            )
+            doc_len = np.fromiter(map(len, tokenized_corpus), dtype=np.float64, count=n_docs)
+            doc_ids = np.repeat(np.arange(n_docs), doc_len.astype(np.int64))
+            
+            # Term-major (CSC) term frequencies: column t lists the docs holding term t.
+            # Counts are exact in float32, halving the postings' value storage.
+            self._tf = sp.csc_matrix(
+                (np.ones(len(term_ids), dtype=np.float32), (doc_ids, term_ids)),
+                shape=(n_docs, len(self._vocab))
+            )
+            self._tf.sum_duplicates()
+            
+            # Okapi idf, with negative values floored at epsilon * mean idf
+            df = np.diff(self._tf.indptr)
+            self._idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+            if self._idf.size:
+                self._idf[self._idf < 0] = BM25_EPSILON * self._idf.mean()
+            # idf * (k1 + 1): the query-independent part of each term's score
+            self._term_weight = self._idf * (BM25_K1 + 1)
             
-            # Create BM25 index
-            self.bm25 = BM25Okapi(tokenized_corpus)
+            # Per-document length normalization from the BM25 denominator
+            avgdl = doc_len.mean() if n_docs and doc_len.any() else 1.0
+            self._len_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avgdl)
+            # Cached term ids refer to the old vocabulary
+            self._q_cache.cache_clear()
             log_event(f"Sparse index initialized with {len(self.corpus)} documents")
         except Exception as e:
             log_event(f"Error initializing sparse index: {str(e)}", level="ERROR")
             raise
     
-    def dense_search(self, query, k=5):
+    def _term_ids(self, query):
+        """Vocabulary ids of a query's tokens, dropping out-of-vocabulary terms."""
+        vocab = self._vocab
+        term_ids = np.fromiter(
+            (vocab[token] for token in query.lower().split() if token in vocab),
+            dtype=np.int64
+        )
+        term_ids.flags.writeable = False
+        return term_ids
+    
+    def _prepare_query(self, query):
+        """Embed and tokenize a query once for both search paths."""
+        embedding = self.embedding_handler.embed_query(query)
+        embedding.flags.writeable = False  # shared by every cache hit
+        return embedding, self._term_ids(query)
+    
+    def dense_search(self, query, k=5, prepared=None):
         """Search using dense embeddings via FAISS."""
         try:
+            if prepared is not None:
+                return self.embedding_handler.search_embedding(prepared[0], k=k)
             results = self.embedding_handler.search(query, k=k)
             return results
         except Exception as e:
             log_event(f"Error in dense search: {str(e)}", level="ERROR")
             return []
     
-    def sparse_search(self, query, k=5):
+    def sparse_search(self, query, k=5, prepared=None):
         """Search using sparse retrieval via BM25."""
         try:
-            query_tokens = query.lower().split()
-            scores = self.bm25.get_scores(query_tokens)
+            term_ids = prepared[1] if prepared is not None else self._term_ids(query)
+            scores = self._bm25_scores(term_ids)
             
-            # Get top-k document indices
-            top_indices = np.argsort(scores)[::-1][:k]
+            # Get top-k document indices: O(N) partition, then sort only the k winners
+            k = min(k, len(scores))
+            if k <= 0:
+                return []
+            top_indices = np.argpartition(scores, -k)[-k:]
+            top_indices = top_indices[np.argsort(scores[top_indices])[::-1]]
             
             # Create results in the same format as dense search
             results = [(self.corpus[idx], float(scores[idx])) for idx in top_indices]
@@ -59,6 +119,16 @@ class HybridRetriever:
             log_event(f"Error in sparse search: {str(e)}", level="ERROR")
             return []
     
+    def _bm25_scores(self, term_ids):
+        """BM25 score of every document, accumulated over each query term's postings."""
+        scores = np.zeros(len(self.corpus))
+        indptr, indices, tf = self._tf.indptr, self._tf.indices, self._tf.data
+        for term_id in term_ids.tolist():
+            start, end = indptr[term_id], indptr[term_id + 1]
+            docs, freqs = indices[start:end], tf[start:end]
+            scores[docs] += self._term_weight[term_id] * freqs / (freqs + self._len_norm[docs])
+        return scores
+    
     def hybrid_search(self, query, k=5, alpha=0.5):
         """
         Perform hybrid search combining dense and sparse retrieval.
@@ -72,9 +142,10 @@ class HybridRetriever:
             list: Combined and reranked results
         """
         try:
-            # Get results from both methods
-            dense_results = self.dense_search(query, k=k*2)  # Get more candidates
-            sparse_results = self.sparse_search(query, k=k*2)
+            # Get results from both methods, sharing one embedding and tokenization
+            prepared = self._q_cache(query)
+            dense_results = self.dense_search(query, k=k*2, prepared=prepared)  # Get more candidates
+            sparse_results = self.sparse_search(query, k=k*2, prepared=prepared)
             
             # Combine results
             combined_results = self._fusion_merge(dense_results, sparse_results, alpha)
@@ -86,6 +157,18 @@ class HybridRetriever:
             # Fall back to dense search if hybrid fails
             return self.dense_search(query, k=k)
     
+    @staticmethod
+    def _weighted_scores(results, weight):
+        """Min-max normalize one result list's scores and apply its fusion weight."""
+        if not results:
+            return (), []
+        # Candidate lists hold 2k entries, where plain float arithmetic beats
+        # the cost of building and converting back from NumPy arrays
+        texts, scores = zip(*results)
+        low = min(scores)
+        scale = weight / ((max(scores) - low) or 1.0)
+        return texts, [(score - low) * scale for score in scores]
+    
     def _fusion_merge(self, dense_results, sparse_results, alpha=0.5):
         """
         Merge dense and sparse results using a weighted approach.
@@ -98,40 +181,17 @@ class HybridRetriever:
         Returns:
             list: Reranked results
         """
-        # Create a dictionary to store combined scores
-        combined_scores = {}
+        # Dense scores are cosine similarities; higher is better on both sides
+        dense_texts, dense_weighted = self._weighted_scores(dense_results, alpha)
+        sparse_texts, sparse_weighted = self._weighted_scores(sparse_results, 1 - alpha)
         
-        # Normalize dense scores
-        if dense_results:
-            max_dense = max(score for _, score in dense_results)
-            min_dense = min(score for _, score in dense_results)
-            dense_range = max_dense - min_dense if max_dense != min_dense else 1.0
-            
-            # Add dense scores to combined scores
-            for text, score in dense_results:
-                # Invert the score as lower distance is better in FAISS
-                normalized_score = 1.0 - ((score - min_dense) / dense_range)
-                combined_scores[text] = alpha * normalized_score
-        
-        # Normalize sparse scores
-        if sparse_results:
-            max_sparse = max(score for _, score in sparse_results)
-            min_sparse = min(score for _, score in sparse_results)
-            sparse_range = max_sparse - min_sparse if max_sparse != min_sparse else 1.0
-            
-            # Add sparse scores to combined scores
-            for text, score in sparse_results:
-                normalized_score = (score - min_sparse) / sparse_range
-                if text in combined_scores:
-                    combined_scores[text] += (1 - alpha) * normalized_score
-                else:
-                    combined_scores[text] = (1 - alpha) * normalized_score
+        # Document strings cache their hash, so these lookups stay cheap
+        combined_scores = dict(zip(dense_texts, dense_weighted))
+        for text, score in zip(sparse_texts, sparse_weighted):
+            combined_scores[text] = combined_scores.get(text, 0.0) + score
         
         # Sort by combined score (descending)
-        sorted_results = [(text, score) for text, score in combined_scores.items()]
-        sorted_results.sort(key=lambda x: x[1], reverse=True)
-        
-        return sorted_results
+        return sorted(combined_scores.items(), key=itemgetter(1), reverse=True)
 
 if __name__ == "__main__":
     retriever = HybridRetriever()
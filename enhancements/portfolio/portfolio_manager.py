@@ -1,10 +1,68 @@
 import os
-import json
+import time
+import orjson
 import datetime
 import re
+import numpy as np
+
+try:
+    import ahocorasick
+except ImportError:  # fall back to one substring test per holding
+    ahocorasick = None
+
+try:
+    from numba import njit
+except ImportError:  # pure-Python kernels when numba is not installed
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
 from utils.logger import log_event
 from enhancements.data_integration.market_data import MarketDataEnricher
 
+# Both are matched as plain substrings of the lowercased query
+_PORTFOLIO_KEYWORDS_RE = re.compile("|".join(map(re.escape, (
+    "my portfolio", "my investments", "my stocks", "my holdings",
+    "my watchlist", "my performance", "my returns", "my balance"
+))))
+_PERSONAL_RE = re.compile("my|i own|i have")
+
+# A summary prices every holding, so repeated requests reuse it this long
+SUMMARY_TTL_SECONDS = 60
+
+@njit(cache=True)
+def _summary_columns(quantity, current_price, tx_holding, tx_price, tx_quantity, tx_is_buy):
+    """Average price, market value, cost basis, gain and % gain per holding."""
+    n = quantity.shape[0]
+    total_cost = np.zeros(n)
+    total_shares = np.zeros(n)
+    for t in range(tx_holding.shape[0]):
+        if tx_is_buy[t]:
+            h = tx_holding[t]
+            total_cost[h] += tx_price[t] * tx_quantity[t]
+            total_shares[h] += tx_quantity[t]
+
+    avg_price = np.zeros(n)
+    market_value = np.empty(n)
+    cost_basis = np.empty(n)
+    gain_loss = np.empty(n)
+    gain_loss_percent = np.zeros(n)
+    for h in range(n):
+        if total_shares[h] > 0:
+            avg_price[h] = total_cost[h] / total_shares[h]
+        market_value[h] = quantity[h] * current_price[h]
+        cost_basis[h] = quantity[h] * avg_price[h]
+        gain_loss[h] = market_value[h] - cost_basis[h]
+        if cost_basis[h] > 0:
+            gain_loss_percent[h] = gain_loss[h] / cost_basis[h] * 100
+    return avg_price, market_value, cost_basis, gain_loss, gain_loss_percent
+
+def warmup_kernels():
+    """Compile (or load from numba's cache) the jitted kernels before the first real request."""
+    # Same dtypes as _holdings_to_arrays() produces, so the real call reuses this signature
+    values = np.zeros(1, dtype=np.float64)
+    _summary_columns(values, values, np.zeros(1, dtype=np.int64), values, values, np.zeros(1, dtype=bool))
+
 class PortfolioManager:
     """
     Manages user portfolios and provides personalized financial insights.
@@ -15,6 +73,11 @@ class PortfolioManager:
         self.user_id = user_id
         self.data_dir = os.path.join("data", "portfolios")
         self.portfolio = self.load_portfolio()
+        # Set when changes are unsaved (deferred or failed), so flush() writes them
+        self._dirty = False
+        # (monotonic time, summary) of the last successful get_portfolio_summary()
+        self._summary_cache = None
+        self._rebuild_symbol_matcher()
         self.market_data = MarketDataEnricher()
         
         # Create data directory if it doesn't exist
@@ -31,10 +94,11 @@ class PortfolioManager:
             portfolio_path = os.path.join(self.data_dir, f"{self.user_id}.json")
             
             if os.path.exists(portfolio_path):
-                with open(portfolio_path, 'r') as f:
-                    return json.load(f)
+                with open(portfolio_path, 'rb') as f:
+                    return orjson.loads(f.read())
             else:
                 # Return empty default portfolio
+                now = datetime.datetime.now().isoformat()
                 return {
                     "user_id": self.user_id,
                     "holdings": [],
@@ -44,8 +108,8 @@ class PortfolioManager:
                         "investment_horizon": "medium",
                         "sectors_of_interest": []
                     },
-                    "created_at": datetime.datetime.now().isoformat(),
-                    "updated_at": datetime.datetime.now().isoformat()
+                    "created_at": now,
+                    "updated_at": now
                 }
         except Exception as e:
             log_event(f"Error loading portfolio for user {self.user_id}: {str(e)}", level="ERROR")
@@ -56,6 +120,17 @@ class PortfolioManager:
                 "preferences": {"risk_profile": "moderate"}
             }
     
+    def _rebuild_symbol_matcher(self):
+        """Index the held symbols for a single scan of the query."""
+        self._symbols = [holding["symbol"].lower() for holding in self.portfolio["holdings"]]
+        self._symbol_automaton = None
+        if ahocorasick and self._symbols:
+            self._symbol_automaton = ahocorasick.Automaton()
+            for symbol in self._symbols:
+                self._symbol_automaton.add_word(symbol, symbol)
+            self._symbol_automaton.make_automaton()
+        self._symbol_matcher_stale = False
+    
     def save_portfolio(self):
         """Save the current portfolio to storage."""
         try:
@@ -64,16 +139,34 @@ class PortfolioManager:
             # Update timestamp
             self.portfolio["updated_at"] = datetime.datetime.now().isoformat()
             
-            with open(portfolio_path, 'w') as f:
-                json.dump(self.portfolio, f, indent=2)
+            # Write-then-rename, so a crash mid-write never leaves a truncated file
+            tmp_path = f"{portfolio_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(self.portfolio, option=orjson.OPT_INDENT_2))
+            os.replace(tmp_path, portfolio_path)
                 
-            log_event(f"Portfolio saved for user {self.user_id}")
+            log_event("Portfolio saved for user %s", self.user_id)
+            self._dirty = False
             return True
         except Exception as e:
             log_event(f"Error saving portfolio for user {self.user_id}: {str(e)}", level="ERROR")
+            self._dirty = True
             return False
     
-    def add_holding(self, symbol, quantity, purchase_price):
+    def flush(self):
+        """Persist the portfolio if it has deferred or failed saves; no-op otherwise."""
+        if self._dirty:
+            return self.save_portfolio()
+        return True
+    
+    def _commit(self, save):
+        """Save now, or just mark the portfolio dirty for a later flush()."""
+        if save:
+            return self.save_portfolio()
+        self._dirty = True
+        return True
+    
+    def add_holding(self, symbol, quantity, purchase_price, save=True):
         """
         Add a stock holding to the user's portfolio.
         
@@ -81,37 +174,38 @@ class PortfolioManager:
             symbol (str): Stock ticker symbol
             quantity (float): Number of shares
             purchase_price (float): Purchase price per share
+            save (bool): Write to disk now; bulk imports pass False and call flush()
             
         Returns:
             bool: Success status
         """
         try:
+            self._summary_cache = None
+            quantity = float(quantity)
+            transaction = {
+                "type": "buy",
+                "quantity": quantity,
+                "price": float(purchase_price),
+                "date": datetime.datetime.now().isoformat()
+            }
+            
             # Check if holding already exists
             for holding in self.portfolio["holdings"]:
                 if holding["symbol"] == symbol:
                     # Update existing holding
-                    holding["quantity"] += float(quantity)
-                    holding["transactions"].append({
-                        "type": "buy",
-                        "quantity": float(quantity),
-                        "price": float(purchase_price),
-                        "date": datetime.datetime.now().isoformat()
-                    })
-                    return self.save_portfolio()
+                    holding["quantity"] += quantity
+                    holding["transactions"].append(transaction)
+                    return self._commit(save)
             
             # Add new holding
+            self._symbol_matcher_stale = True
             self.portfolio["holdings"].append({
                 "symbol": symbol,
-                "quantity": float(quantity),
-                "transactions": [{
-                    "type": "buy",
-                    "quantity": float(quantity),
-                    "price": float(purchase_price),
-                    "date": datetime.datetime.now().isoformat()
-                }]
+                "quantity": quantity,
+                "transactions": [transaction]
             })
             
-            return self.save_portfolio()
+            return self._commit(save)
         except Exception as e:
             log_event(f"Error adding holding {symbol} for user {self.user_id}: {str(e)}", level="ERROR")
             return False
@@ -127,6 +221,8 @@ class PortfolioManager:
             bool: Success status
         """
         try:
+            self._summary_cache = None
+            
             # Update preferences
             for key, value in preferences.items():
                 self.portfolio["preferences"][key] = value
@@ -136,13 +232,39 @@ class PortfolioManager:
             log_event(f"Error updating preferences for user {self.user_id}: {str(e)}", level="ERROR")
             return False
     
+    def _holdings_to_arrays(self):
+        """
+        Holdings and their transactions as flat columns.
+        
+        Returns:
+            tuple: symbols (list), quantity per holding, and per transaction the
+            owning holding's index, price, quantity and whether it is a buy
+        """
+        holdings = self.portfolio["holdings"]
+        transactions = [holding.get("transactions", []) for holding in holdings]
+        flat = [t for holding_transactions in transactions for t in holding_transactions]
+        
+        symbols = [holding["symbol"] for holding in holdings]
+        quantity = np.fromiter((h["quantity"] for h in holdings), dtype=np.float64, count=len(holdings))
+        tx_holding = np.repeat(np.arange(len(holdings)), [len(t) for t in transactions])
+        tx_price = np.fromiter((t["price"] for t in flat), dtype=np.float64, count=len(flat))
+        tx_quantity = np.fromiter((t["quantity"] for t in flat), dtype=np.float64, count=len(flat))
+        tx_is_buy = np.fromiter((t["type"] == "buy" for t in flat), dtype=bool, count=len(flat))
+        return symbols, quantity, tx_holding, tx_price, tx_quantity, tx_is_buy
+    
     def get_portfolio_summary(self):
         """
         Generate a summary of the user's portfolio with current market values.
         
+        The result is reused for SUMMARY_TTL_SECONDS, or until the holdings or
+        preferences change, so callers must not modify it.
+        
         Returns:
             dict: Portfolio summary
         """
+        cached = self._summary_cache
+        if cached is not None and time.monotonic() - cached[0] < SUMMARY_TTL_SECONDS:
+            return cached[1]
         try:
             summary = {
                 "total_value": 0.0,
@@ -152,45 +274,40 @@ class PortfolioManager:
                 "risk_profile": self.portfolio["preferences"].get("risk_profile", "moderate"),
             }
             
-            # Process each holding
-            for holding in self.portfolio["holdings"]:
-                symbol = holding["symbol"]
-                quantity = holding["quantity"]
-                
-                # Get current price
-                stock_data = self.market_data.fetch_stock_data(symbol)
-                
-                if stock_data and "price" in stock_data:
-                    current_price = float(stock_data["price"])
-                    
-                    # Calculate average purchase price
-                    transactions = holding.get("transactions", [])
-                    total_cost = sum(t["price"] * t["quantity"] for t in transactions if t["type"] == "buy")
-                    total_shares = sum(t["quantity"] for t in transactions if t["type"] == "buy")
-                    avg_price = total_cost / total_shares if total_shares > 0 else 0
-                    
-                    # Calculate values
-                    market_value = quantity * current_price
-                    cost_basis = quantity * avg_price
-                    gain_loss = market_value - cost_basis
-                    gain_loss_percent = (gain_loss / cost_basis * 100) if cost_basis > 0 else 0
-                    
-                    # Add to summary
-                    summary["holdings"].append({
-                        "symbol": symbol,
-                        "quantity": quantity,
-                        "current_price": current_price,
-                        "market_value": market_value,
-                        "avg_price": avg_price,
-                        "cost_basis": cost_basis,
-                        "gain_loss": gain_loss,
-                        "gain_loss_percent": gain_loss_percent
-                    })
-                    
-                    summary["total_value"] += market_value
+            symbols, quantity, tx_holding, tx_price, tx_quantity, tx_is_buy = self._holdings_to_arrays()
+            
+            # Current prices for every holding in one concurrent fetch
+            quotes = self.market_data.fetch_stocks(symbols)
+            priced = np.fromiter(
+                (symbol in quotes and "price" in quotes[symbol] for symbol in symbols),
+                dtype=bool, count=len(symbols)
+            )
+            current_price = np.array(
+                [float(quotes[symbol]["price"]) if ok else np.nan for symbol, ok in zip(symbols, priced)],
+                dtype=np.float64
+            )
+            
+            # Average purchase price over buy transactions, then values, in one kernel
+            avg_price, market_value, cost_basis, gain_loss, gain_loss_percent = _summary_columns(
+                quantity, current_price, tx_holding, tx_price, tx_quantity, tx_is_buy
+            )
+            
+            # Holdings without a current price are left out, as before
+            columns = {
+                "quantity": quantity, "current_price": current_price, "market_value": market_value,
+                "avg_price": avg_price, "cost_basis": cost_basis, "gain_loss": gain_loss,
+                "gain_loss_percent": gain_loss_percent
+            }
+            columns = {name: values[priced].tolist() for name, values in columns.items()}
+            priced_symbols = [symbol for symbol, ok in zip(symbols, priced) if ok]
+            summary["holdings"] = [
+                {"symbol": symbol, **dict(zip(columns, row))}
+                for symbol, row in zip(priced_symbols, zip(*columns.values()))
+            ]
+            summary["total_value"] = float(market_value[priced].sum())
             
             # Calculate overall performance
-            total_cost = sum(h["cost_basis"] for h in summary["holdings"])
+            total_cost = float(cost_basis[priced].sum())
             if total_cost > 0:
                 summary["performance"]["total_gain"] = summary["total_value"] - total_cost
                 summary["performance"]["total_gain_percent"] = summary["performance"]["total_gain"] / total_cost * 100
@@ -200,6 +317,7 @@ class PortfolioManager:
                 allocation = (holding["market_value"] / summary["total_value"]) * 100 if summary["total_value"] > 0 else 0
                 summary["asset_allocation"][holding["symbol"]] = allocation
             
+            self._summary_cache = (time.monotonic(), summary)
             return summary
         except Exception as e:
             log_event(f"Error generating portfolio summary for user {self.user_id}: {str(e)}", level="ERROR")
@@ -215,92 +333,99 @@ class PortfolioManager:
         Returns:
             bool: Whether the query is portfolio-related
         """
-        portfolio_keywords = [
-            "my portfolio", "my investments", "my stocks", "my holdings",
-            "my watchlist", "my performance", "my returns", "my balance"
-        ]
+        query = query.lower()
         
         # Check for portfolio keywords
-        for keyword in portfolio_keywords:
-            if keyword.lower() in query.lower():
-                return True
-        
-        # Check for user's specific holdings
-        for holding in self.portfolio["holdings"]:
-            if holding["symbol"].lower() in query.lower() and any(personal in query.lower() for personal in ["my", "i own", "i have"]):
-                return True
+        if _PORTFOLIO_KEYWORDS_RE.search(query):
+            return True
         
-        return False
+        # Check for the user's specific holdings, mentioned in a personal way
+        if not _PERSONAL_RE.search(query):
+            return False
+        if self._symbol_matcher_stale:
+            self._rebuild_symbol_matcher()
+        if self._symbol_automaton is not None:
+            return next(self._symbol_automaton.iter(query), None) is not None
+        return any(symbol in query for symbol in self._symbols)
     
-    def get_portfolio_context(self):
+    def get_portfolio_context(self, summary=None):
         """
         Get portfolio context for personalizing responses.
         
+        Args:
+            summary (dict): Portfolio summary to render; fetched if not given
+            
         Returns:
             str: Portfolio context
         """
         try:
-            summary = self.get_portfolio_summary()
+            if summary is None:
+                summary = self.get_portfolio_summary()
             
-            context = f"""
+            parts = [f"""
             The user has a {summary['risk_profile']} risk profile with a portfolio valued at ${summary['total_value']:.2f}.
             
             Holdings:
-            """
+            """]
             
-            for holding in summary["holdings"]:
-                context += f"- {holding['symbol']}: {holding['quantity']} shares (${holding['market_value']:.2f}, {holding['gain_loss_percent']:.2f}% return)\n"
+            parts.extend(
+                f"- {holding['symbol']}: {holding['quantity']} shares (${holding['market_value']:.2f}, {holding['gain_loss_percent']:.2f}% return)\n"
+                for holding in summary["holdings"]
+            )
             
-            context += f"\nOverall return: ${summary['performance']['total_gain']:.2f} ({summary['performance']['total_gain_percent']:.2f}%)"
+            parts.append(f"\nOverall return: ${summary['performance']['total_gain']:.2f} ({summary['performance']['total_gain_percent']:.2f}%)")
             
-            return context
+            return "".join(parts)
         except Exception as e:
             log_event(f"Error getting portfolio context for user {self.user_id}: {str(e)}", level="ERROR")
             return "User has a portfolio, but details couldn't be retrieved."
     
-    def contextualize_response(self, base_response, portfolio_context):
+    def contextualize_response(self, base_response, portfolio_context, summary=None):
         """
         Contextualize a response with the user's portfolio information.
         
         Args:
             base_response (str): Base RAG response
             portfolio_context (str): Portfolio context
+            summary (dict): Portfolio summary behind the insights; fetched if not given
             
         Returns:
             str: Personalized response
         """
         try:
-            personalized_response = f"Based on your investment profile:\n\n{base_response}\n\n"
-            
-            personalized_response += "\n## Your Portfolio Analysis\n"
-            personalized_response += portfolio_context
+            parts = [
+                f"Based on your investment profile:\n\n{base_response}\n\n",
+                "\n## Your Portfolio Analysis\n",
+                portfolio_context
+            ]
             
             # Extract portfolio insights
-            summary = self.get_portfolio_summary()
+            if summary is None:
+                summary = self.get_portfolio_summary()
             
             # Add personalized recommendations
             if summary["total_value"] > 0:
-                personalized_response += "\n\n## Personalized Insights\n"
+                parts.append("\n\n## Personalized Insights\n")
                 
                 # Risk profile-based recommendations
                 if summary["risk_profile"] == "conservative":
-                    personalized_response += "\nConsidering your conservative risk profile, you might want to focus on stability and income."
+                    parts.append("\nConsidering your conservative risk profile, you might want to focus on stability and income.")
                 elif summary["risk_profile"] == "aggressive":
-                    personalized_response += "\nWith your aggressive risk profile, you might be open to higher-growth opportunities, balanced with your existing positions."
+                    parts.append("\nWith your aggressive risk profile, you might be open to higher-growth opportunities, balanced with your existing positions.")
                 else:  # moderate
-                    personalized_response += "\nWith your moderate risk approach, continuing to balance growth and stability may be appropriate."
+                    parts.append("\nWith your moderate risk approach, continuing to balance growth and stability may be appropriate.")
                 
                 # Diversification advice
                 if len(summary["holdings"]) < 3:
-                    personalized_response += "\n\nYour portfolio appears to have limited diversification. Consider adding positions across different sectors to reduce risk."
+                    parts.append("\n\nYour portfolio appears to have limited diversification. Consider adding positions across different sectors to reduce risk.")
                 
                 # Performance-based advice
                 if summary["performance"]["total_gain_percent"] < 0:
-                    personalized_response += "\n\nYour portfolio is currently showing a loss. Remember that investing is long-term, and short-term fluctuations are normal."
+                    parts.append("\n\nYour portfolio is currently showing a loss. Remember that investing is long-term, and short-term fluctuations are normal.")
                 elif summary["performance"]["total_gain_percent"] > 20:
-                    personalized_response += "\n\nYour portfolio is performing well. Consider if rebalancing might be appropriate to lock in some gains while maintaining your desired allocation."
+                    parts.append("\n\nYour portfolio is performing well. Consider if rebalancing might be appropriate to lock in some gains while maintaining your desired allocation.")
             
-            return personalized_response
+            return "".join(parts)
         except Exception as e:
             log_event(f"Error contextualizing response for user {self.user_id}: {str(e)}", level="ERROR")
             return base_response  # Fall back to base response
@@ -318,8 +443,10 @@ class PortfolioManager:
         """
         try:
             if self.is_portfolio_related(query):
-                portfolio_context = self.get_portfolio_context()
-                return self.contextualize_response(base_response, portfolio_context)
+                # One summary (and one market-data fetch) for both sections
+                summary = self.get_portfolio_summary()
+                portfolio_context = self.get_portfolio_context(summary)
+                return self.contextualize_response(base_response, portfolio_context, summary)
             return base_response
         except Exception as e:
             log_event(f"Error personalizing response for user {self.user_id}: {str(e)}", level="ERROR")
@@ -338,7 +465,7 @@ if __name__ == "__main__":
     
     # Get portfolio summary
     summary = manager.get_portfolio_summary()
-    print(json.dumps(summary, indent=2, default=str))
+    print(orjson.dumps(summary, default=str, option=orjson.OPT_INDENT_2).decode())
     
     # Test personalizing a response
     query = "How are my investments performing with current market conditions?"
@@ -1,7 +1,20 @@
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from embeddings.embedding import EmbeddingHandler
 from utils.logger import log_event
 
+# Files are read concurrently; reads release the GIL
+KB_READ_WORKERS = 16
+# Paragraph boundary: a blank (or whitespace-only) line
+PARA_RE = re.compile(rb'\n\s*\n')
+
+def _read_paragraphs(path):
+    """Read one file as bytes and return its non-empty paragraphs as text."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    return [p.decode('utf-8') for p in (p.strip() for p in PARA_RE.split(content)) if p]
+
 def load_knowledge_base():
     """Load and process all knowledge base text files."""
     kb_dir = "./knowledge_base"
@@ -12,14 +25,15 @@ def load_knowledge_base():
         if not os.path.exists(kb_dir):
             raise FileNotFoundError(f"Knowledge base directory not found: {kb_dir}")
         
-        # Read all text files from knowledge base directory
-        for filename in sorted(os.listdir(kb_dir)):
-            if filename.endswith(".txt"):
-                with open(os.path.join(kb_dir, filename), 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    # Split content into smaller chunks (you can adjust the chunk size)
-                    paragraphs = [p.strip() for p in content.split('\n\n') if p.strip()]
-                    text_chunks.extend(paragraphs)
+        # Read all text files from knowledge base directory, keeping filename order
+        paths = [
+            os.path.join(kb_dir, filename)
+            for filename in sorted(os.listdir(kb_dir))
+            if filename.endswith(".txt")
+        ]
+        with ThreadPoolExecutor(max_workers=KB_READ_WORKERS) as executor:
+            for paragraphs in executor.map(_read_paragraphs, paths):
+                text_chunks.extend(paragraphs)
         
         log_event(f"Loaded {len(text_chunks)} text chunks from knowledge base")
         return text_chunks
@@ -43,6 +57,7 @@ def main():
         # Initialize embedding handler and add chunks to index
         embedder = EmbeddingHandler()
         embedder.add_to_index(text_chunks)
+        embedder.flush()
         log_event("Knowledge base initialization complete")
     except Exception as e:
         log_event(f"Error during initialization: {str(e)}", level="ERROR")
@@ -1,13 +1,27 @@
 import ollama
-from retrieval.retriever import FinanceRetriever
-from config import LLM_MODEL
-from utils.logger import log_event
+from concurrent.futures import ThreadPoolExecutor
+from retrieval.retriever import FinanceRetriever, RetrievalBatcher
+from llm.response_cache import FileCache
+from config import LLM_MODEL, FAST_LLM_MODEL
+from utils.logger import log_event, log_enabled
+
+# Answer shown instead of the LLM's when Ollama is unavailable or fails
+FALLBACK_HEADER = "Based on the retrieved information:\n\n"
+# Answer when retrieval finds nothing, rather than prompting with an empty context
+NO_CONTEXT_RESPONSE = "I couldn't find any relevant information in the knowledge base for that question."
+# Most Ollama requests generate_batch keeps in flight at once
+GENERATE_BATCH_MAX_WORKERS = 8
 
 class LLMInterface:
     def __init__(self):
         """Initialize retriever for fetching relevant finance data."""
-        self.retriever = FinanceRetriever()
+        self.retriever = FinanceRetriever.instance()
+        # Concurrent requests (Flask serves each on its own thread) share searches
+        self._retrieval = RetrievalBatcher(self.retriever)
         self.model = LLM_MODEL
+        self.fast_model = FAST_LLM_MODEL
+        # Identical prompts (same query and retrieved context) skip generation
+        self.response_cache = FileCache()
         self.ollama_available = self._check_ollama()
         
     def _check_ollama(self):
@@ -33,40 +47,174 @@ class LLMInterface:
             log_event(f"Ollama is not available: {str(e)}", level="WARNING")
             return False
 
-    def generate_response(self, user_query):
-        """Retrieve relevant knowledge and generate an AI response."""
-        try:
-            retrieved_chunks = self.retriever.retrieve(user_query)
-            
-            # Log the retrieved chunks
-            log_event(f"Retrieved {len(retrieved_chunks)} chunks for query: {user_query}")
+    def _retrieve(self, user_query):
+        """Retrieve context chunks for a query."""
+        retrieved_chunks = self._retrieval.retrieve(user_query)
+        
+        # Log the retrieved chunks
+        log_event("Retrieved %d chunks for query: %s", len(retrieved_chunks), user_query)
+        if log_enabled("DEBUG"):
             for i, (chunk, score) in enumerate(retrieved_chunks):
-                log_event(f"Chunk {i+1}: {chunk[:100]}... (score: {score:.4f})")
-            
-            context = " ".join([chunk[0] for chunk in retrieved_chunks])
+                log_event("Chunk %d: %.100s... (similarity: %.4f)", i + 1, chunk, score, level="DEBUG")
+        return retrieved_chunks
 
-            prompt = f"""
+    @staticmethod
+    def _build_prompt(user_query, retrieved_chunks):
+        """Render the answer prompt for a query and its retrieved context."""
+        context = " ".join(chunk for chunk, _ in retrieved_chunks)
+
+        return f"""
             You are an AI finance assistant. Answer based on the provided knowledge only.
             Query: {user_query}
             Context: {context}
             """
 
-            if self.ollama_available:
-                try:
-                    response = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}])
-                    return response['message']['content']
-                except Exception as e:
-                    log_event(f"Error generating response with Ollama: {str(e)}", level="ERROR")
-                    # Fall back to direct retrieval if Ollama fails
-                    return f"Based on the retrieved information:\n\n" + "\n\n".join([f"- {chunk[0]}" for chunk in retrieved_chunks])
-            else:
-                # If Ollama is not available, use retrieved chunks directly
-                log_event("Using retrieved chunks directly as Ollama is not available")
-                return f"Based on the retrieved information:\n\n" + "\n\n".join([f"- {chunk[0]}" for chunk in retrieved_chunks])
-                
+    @staticmethod
+    def _render_fallback(retrieved_chunks):
+        """Answer made of the retrieved chunks, used when Ollama can't generate one."""
+        return FALLBACK_HEADER + "\n\n".join("- " + chunk for chunk, _ in retrieved_chunks)
+
+    def _chat(self, model, prompt):
+        """Single-turn Ollama completion, served from the response cache when possible."""
+        cached = self.response_cache.get(model, prompt)
+        if cached is not None:
+            return cached
+        response = ollama.chat(model=model, messages=[{"role": "user", "content": prompt}])
+        content = response['message']['content']
+        self.response_cache.set(model, prompt, content)
+        return content
+
+    def _answer(self, user_query, retrieved_chunks):
+        """
+        Generate the answer for a query from its retrieved chunks, with the usual fallbacks.
+
+        Returns:
+            tuple: (response, whether the LLM generated it rather than a fallback)
+        """
+        if not retrieved_chunks:
+            return NO_CONTEXT_RESPONSE, False
+
+        if not self.ollama_available:
+            # If Ollama is not available, use retrieved chunks directly
+            log_event("Using retrieved chunks directly as Ollama is not available")
+            return self._render_fallback(retrieved_chunks), False
+
+        try:
+            return self._chat(self.model, self._build_prompt(user_query, retrieved_chunks)), True
+        except Exception as e:
+            log_event(f"Error generating response with Ollama: {str(e)}", level="ERROR")
+            # Fall back to direct retrieval if Ollama fails
+            return self._render_fallback(retrieved_chunks), False
+
+    def generate_response(self, user_query):
+        """Retrieve relevant knowledge and generate an AI response."""
+        return self.generate_response_with_status(user_query)[0]
+
+    def generate_response_with_status(self, user_query):
+        """
+        Like generate_response, but also tell whether the answer came from the LLM.
+
+        Error messages and the fallbacks (retrieved chunks, no context found)
+        are flagged False, so callers caching answers can leave them out.
+
+        Returns:
+            tuple: (response, generated)
+        """
+        try:
+            return self._answer(user_query, self._retrieve(user_query))
         except Exception as e:
             log_event(f"Error generating response: {str(e)}", level="ERROR")
-            return f"Sorry, I encountered an error: {str(e)}"
+            return f"Sorry, I encountered an error: {str(e)}", False
+
+    def generate_batch(self, user_queries):
+        """
+        Generate responses for several queries at once.
+
+        Context for all of them comes from one batched retrieval, and the Ollama
+        requests are sent concurrently so the server can batch their decoding.
+
+        Args:
+            user_queries (list): User queries
+
+        Returns:
+            list: One response per query, in order
+        """
+        if not user_queries:
+            return []
+        try:
+            retrieved = self.retriever.retrieve_batch(list(user_queries))
+        except Exception as e:
+            log_event(f"Error generating responses: {str(e)}", level="ERROR")
+            return [f"Sorry, I encountered an error: {str(e)}"] * len(user_queries)
+
+        workers = min(len(user_queries), GENERATE_BATCH_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return [response for response, _ in executor.map(self._answer, user_queries, retrieved)]
+
+    def generate_response_stream(self, user_query):
+        """
+        Like generate_response, but yield the answer in pieces as Ollama produces them.
+
+        The fallbacks of generate_response are yielded as a single piece. The
+        generator's return value (StopIteration.value) is True only when the
+        whole answer came from the LLM, as in generate_response_with_status.
+        """
+        try:
+            retrieved_chunks = self._retrieve(user_query)
+        except Exception as e:
+            log_event(f"Error generating response: {str(e)}", level="ERROR")
+            yield f"Sorry, I encountered an error: {str(e)}"
+            return False
+
+        if not retrieved_chunks:
+            yield NO_CONTEXT_RESPONSE
+            return False
+
+        if not self.ollama_available:
+            log_event("Using retrieved chunks directly as Ollama is not available")
+            yield self._render_fallback(retrieved_chunks)
+            return False
+
+        prompt = self._build_prompt(user_query, retrieved_chunks)
+
+        cached = self.response_cache.get(self.model, prompt)
+        if cached is not None:
+            yield cached
+            return True
+
+        tokens = []
+        try:
+            stream = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}], stream=True)
+            for part in stream:
+                token = part['message']['content']
+                if token:
+                    tokens.append(token)
+                    yield token
+            # Only a completed stream is cached
+            self.response_cache.set(self.model, prompt, "".join(tokens))
+            return True
+        except Exception as e:
+            log_event(f"Error streaming response with Ollama: {str(e)}", level="ERROR")
+            # Only fall back if nothing reached the caller yet
+            if not tokens:
+                yield self._render_fallback(retrieved_chunks)
+            return False
+
+    def generate_response_fast(self, prompt):
+        """
+        Send a self-contained prompt to the smaller model, without retrieval.
+
+        Falls back to the default model if the fast one fails, and returns None
+        when neither is reachable so callers can regenerate from scratch.
+        """
+        if not self.ollama_available:
+            return None
+        for model in dict.fromkeys((self.fast_model, self.model)):
+            try:
+                return self._chat(model, prompt)
+            except Exception as e:
+                log_event(f"Error generating fast response with {model}: {str(e)}", level="WARNING")
+        return None
 
 if __name__ == "__main__":
     llm = LLMInterface()
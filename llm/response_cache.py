@@ -0,0 +1,42 @@
+import os
+import hashlib
+from utils.caching import DISK_CACHE_SIZE_LIMIT, DiskCache
+from utils.logger import log_event
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "llm")
+DEFAULT_TTL_SECONDS = 7 * 86400
+
+class FileCache:
+    """
+    On-disk cache of LLM responses: one JSON file per (model, prompt) in a
+    DiskCache under ``cache_dir``, deleted once older than ``ttl_seconds``
+    and pruned least recently used first past ``size_limit`` bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS, size_limit=DISK_CACHE_SIZE_LIMIT):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self._disk = DiskCache(cache_dir, ttl_seconds, size_limit=size_limit)
+
+    @staticmethod
+    def key(model, prompt):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\x1f")
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, model, prompt):
+        """Cached response for ``prompt`` from ``model``, or None if missing or expired."""
+        found, _, response = self._disk.get(self.key(model, prompt))
+        if not found:
+            return None
+        log_event("LLM response cache hit for model %s", model)
+        return response
+
+    def set(self, model, prompt, response):
+        """Store a response; failures are logged and otherwise ignored."""
+        try:
+            self._disk.put(self.key(model, prompt), response)
+        except (OSError, TypeError) as e:
+            log_event(f"Error writing LLM response cache: {str(e)}", level="WARNING")
@@ -32,7 +32,34 @@ class FinanceChatbot:
         """
         # Generate base response
         response = self.llm.generate_response(query)
+        return self._enhance_response(query, response, enrich, personalize)
+    
+    def process_query_stream(self, query, enrich=True, personalize=True):
+        """
+        Like process_query, but yield the answer as it is generated.
+        
+        Enrichment and personalization need the whole answer, so what they add
+        after it is yielded once the stream completes. Anything they would put
+        before it is dropped, since the answer has already been shown.
         
+        Yields:
+            str: Pieces of the enhanced response
+        """
+        tokens = []
+        for token in self.llm.generate_response_stream(query):
+            tokens.append(token)
+            yield token
+        base_response = "".join(tokens)
+        
+        response = self._enhance_response(query, base_response, enrich, personalize)
+        _, found, suffix = response.partition(base_response)
+        if not found:
+            suffix = "\n\n" + response
+        if suffix:
+            yield suffix
+    
+    def _enhance_response(self, query, response, enrich, personalize):
+        """Apply market-data enrichment and portfolio personalization to a base response."""
         # Enrich with market data if requested
         if enrich:
             response = self.market_data.enrich_response(query, response)
@@ -59,28 +86,32 @@ class FinanceChatbot:
         while True:
             print("\n" + "-" * 50)
             query = input("You: ").strip()
+            command = query.lower()
             
-            if query.lower() == 'exit':
+            if command == 'exit':
                 print("\nThank you for using the Enhanced Finance Advisor!")
                 break
                 
-            elif query.lower() == 'help':
+            elif command == 'help':
                 print("\nAvailable commands:")
                 for cmd, desc in commands.items():
                     print(f"  - {cmd}: {desc}")
                 continue
                 
-            elif query.lower() == 'portfolio' and self.portfolio_manager:
+            elif command == 'portfolio' and self.portfolio_manager:
                 self._handle_portfolio_commands()
                 continue
                 
-            elif query.lower() == 'market':
+            elif command == 'market':
                 self._handle_market_commands()
                 continue
             
-            # Process regular query
-            response = self.process_query(query)
-            print(f"\nAI: {response}")
+            # Process regular query, printing the answer as it streams in
+            sys.stdout.write("\nAI: ")
+            for token in self.process_query_stream(query):
+                sys.stdout.write(token)
+                sys.stdout.flush()
+            sys.stdout.write("\n")
     
     def _handle_portfolio_commands(self):
         """Handle portfolio management commands."""
@@ -135,8 +166,10 @@ class FinanceChatbot:
             symbols = input("Enter stock symbols (comma-separated): ").strip().upper()
             symbols_list = [s.strip() for s in symbols.split(',') if s.strip()]
             
+            # All quotes are requested concurrently, then printed in input order
+            quotes = self.market_data.fetch_stocks(symbols_list)
             for symbol in symbols_list:
-                data = self.market_data.fetch_stock_data(symbol)
+                data = quotes.get(symbol)
                 if data:
                     print(f"\n{symbol}: ${data['price']} ({data['change_percent']})")
                     print(f"Volume: {data['volume']}")
@@ -1,26 +1,146 @@
-import faiss
-import pickle
+import os
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from config import FAISS_INDEX_PATH, FAISS_METADATA_PATH, EMBEDDING_MODEL
+from config import FAISS_INDEX_PATH, EMBEDDING_MODEL
+from embeddings.embedding import ENCODE_BATCH_SIZE, index_to_gpu, load_embedding_model, load_metadata, read_index_mapped
+from utils.caching import DiskCache
+from utils.logger import log_event
+
+# In-memory LRU sizes for query embeddings and search results
+EMBEDDING_CACHE_SIZE = 4096
+RESULT_CACHE_SIZE = 4096
+# Search results are also kept on disk, one JSON file per (query, top_k)
+RESULT_CACHE_DIR = os.path.join(".cache", "retrieval")
+RESULT_CACHE_TTL_SECONDS = 24 * 3600
+
+def _lru_get(cache, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+def _lru_put(cache, key, value, maxsize):
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > maxsize:
+        cache.popitem(last=False)
+
+_singleton = None
+_singleton_lock = threading.Lock()
 
 class FinanceRetriever:
     def __init__(self):
         """Load FAISS index and embeddings model."""
-        self.index = faiss.read_index(FAISS_INDEX_PATH)
-        with open(FAISS_METADATA_PATH, "rb") as f:
-            self.metadata = pickle.load(f)
-        self.model = SentenceTransformer(EMBEDDING_MODEL)
+        # faiss is only needed once a retriever is actually built
+        import faiss
+        # Read-only and mapped from the file (see read_index_mapped). With a
+        # GPU the index is copied to device memory instead.
+        index = read_index_mapped(FAISS_INDEX_PATH)
+        # Indexes built before the switch to inner product hold the same unit
+        # vectors under L2; squared distance d is then cosine similarity 1 - d / 2
+        self._l2_index = index.metric_type != faiss.METRIC_INNER_PRODUCT
+        if self._l2_index:
+            log_event("FAISS index uses L2; rebuild it with init_knowledge_base.py to search by inner product.", level="WARNING")
+        self.index = index_to_gpu(index)
+        self.metadata = load_metadata(mmap=True)
+        self.model = load_embedding_model(EMBEDDING_MODEL)
+
+        # Cached results are only valid for the index they came from
+        self._index_salt = f"{index.metric_type}:{self.index.ntotal}:{os.path.getmtime(FAISS_INDEX_PATH)}"
+        self._cache_lock = threading.Lock()
+        self._embedding_cache = OrderedDict()
+        self._result_cache = OrderedDict()
+        self._disk_cache = DiskCache(RESULT_CACHE_DIR, RESULT_CACHE_TTL_SECONDS)
+
+    @classmethod
+    def instance(cls):
+        """Process-wide retriever, so the model and index are loaded only once."""
+        global _singleton
+        if _singleton is None:
+            with _singleton_lock:
+                if _singleton is None:
+                    _singleton = cls()
+        return _singleton
+
+    @staticmethod
+    def _normalize_query(query):
+        # The embedding model is uncased, so case doesn't change the vector
+        return query.strip().lower()
+
+    def _result_key(self, query_norm, top_k):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{self._index_salt}\x1f{top_k}\x1f{query_norm}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _load_result(self, key):
+        """Results for ``key`` from the disk cache, if present and younger than the TTL."""
+        found, _, results = self._disk_cache.get(key)
+        return [tuple(result) for result in results] if found else None
+
+    def _store_result(self, key, results):
+        try:
+            self._disk_cache.put(key, results)
+        except (OSError, TypeError):
+            pass  # the disk tier is best-effort
+
+    def _embed(self, queries_norm):
+        """(n, dim) normalized embeddings, encoding only queries not seen recently."""
+        with self._cache_lock:
+            cached = [_lru_get(self._embedding_cache, q) for q in queries_norm]
+        missing = list(dict.fromkeys(q for q, vec in zip(queries_norm, cached) if vec is None))
+        if missing:
+            # The index stores L2-normalized vectors, so queries must be normalized too
+            encoded = self.model.encode(
+                missing,
+                batch_size=ENCODE_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ).astype(np.float32, copy=False)
+            fresh = dict(zip(missing, encoded))
+            with self._cache_lock:
+                for q, vec in fresh.items():
+                    _lru_put(self._embedding_cache, q, vec, EMBEDDING_CACHE_SIZE)
+            cached = [fresh[q] if vec is None else vec for q, vec in zip(queries_norm, cached)]
+        return np.stack(cached)
 
     def retrieve(self, query, top_k=5):
         """Finds top K relevant chunks for a given query."""
-        query_embedding = np.array([self.model.encode(query)], dtype=np.float32)
-        distances, indices = self.index.search(query_embedding, top_k)
-        results = [(self.metadata[idx], distances[0][i]) for i, idx in enumerate(indices[0])]
-        return results
+        return self.retrieve_batch([query], top_k)[0]
+
+    def retrieve_batch(self, queries, top_k=5):
+        """Finds top K chunks for each query with one encode pass and one index search."""
+        queries_norm = [self._normalize_query(query) for query in queries]
+        keys = [self._result_key(q, top_k) for q in queries_norm]
+
+        with self._cache_lock:
+            results = [_lru_get(self._result_cache, key) for key in keys]
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = self._load_result(key)
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            query_embeddings = self._embed([queries_norm[i] for i in pending])
+            distances, indices = self.index.search(query_embeddings, top_k)
+            if self._l2_index:
+                distances = 1.0 - distances / 2
+            for i, row_ids, row_dists in zip(pending, indices.tolist(), distances.tolist()):
+                results[i] = [
+                    (self.metadata[idx], dist) for idx, dist in zip(row_ids, row_dists) if idx != -1
+                ]
+                self._store_result(keys[i], results[i])
+
+        with self._cache_lock:
+            for key, result in zip(keys, results):
+                _lru_put(self._result_cache, key, result, RESULT_CACHE_SIZE)
+        # Copies, so callers can't mutate cached lists
+        return [list(result) for result in results]
 
 if __name__ == "__main__":
-    retriever = FinanceRetriever()
+    retriever = FinanceRetriever.instance()
     query = "What are the key risk management strategies in hedge funds?"
     print(f"🔎 Query: {query}")
     print("📚 Relevant Chunks:")
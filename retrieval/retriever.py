@@ -1,32 +1,278 @@
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+import numpy as np
+from config import FAISS_INDEX_PATH
 from embeddings.embedding import EmbeddingHandler
+from utils.caching import CachedFailure, ResultCache
 from utils.logger import log_event
 
+# Most queries coalesced into one retrieve_batch call
+RETRIEVE_MAX_BATCH = 64
+# Semantic cache: results of the most recent searches, served again for a
+# query whose embedding is at least this similar to a cached one
+SEMANTIC_CACHE_SIZE = 40
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL_SECONDS = 300
+# Exact (query, k) results are also kept on disk, so they survive restarts
+RESULT_CACHE_DIR = os.path.join(".cache", "retriever")
+RESULT_CACHE_TTL_SECONDS = 24 * 3600
+# Empty results and failures are remembered this briefly, in memory only, so
+# a failing backend isn't searched (and logged) again for every repeat
+NEGATIVE_RESULT_TTL_SECONDS = 10
+# Query embeddings kept in memory, so a query is encoded once per process
+EMBEDDING_CACHE_SIZE = 4096
+
+_singleton = None
+_singleton_lock = threading.Lock()
+
 class FinanceRetriever:
     def __init__(self):
         """Initialize retriever for fetching relevant finance data."""
         try:
             self.embedder = EmbeddingHandler()
+            # Exact (query, k) repeats skip encoding; paraphrases use the semantic cache.
+            # Keys carry the index size and file version, so new chunks invalidate them.
+            self._result_cache = ResultCache(ttl=RESULT_CACHE_TTL_SECONDS, persist_dir=RESULT_CACHE_DIR)
+            self._index_salt = os.path.getmtime(FAISS_INDEX_PATH) if os.path.exists(FAISS_INDEX_PATH) else 0.0
+            # Embeddings don't depend on the index, so they never expire
+            self._embedding_cache = ResultCache(max_size=EMBEDDING_CACHE_SIZE, ttl=float("inf"))
+            self._init_semantic_cache()
             log_event("Retriever initialized successfully")
         except Exception as e:
-            log_event(f"Error initializing retriever: {str(e)}", level="ERROR")
+            log_event("Error initializing retriever: %s", e, level="ERROR")
             raise
 
+    @classmethod
+    def instance(cls):
+        """Process-wide retriever, so the model and index are loaded only once."""
+        global _singleton
+        if _singleton is None:
+            with _singleton_lock:
+                if _singleton is None:
+                    _singleton = cls()
+        return _singleton
+
+    def _init_semantic_cache(self):
+        """Fixed slots of (embedding, k, index size, results, stored at, last used)."""
+        dim = self.embedder.model.get_sentence_embedding_dimension()
+        self._cache_vecs = np.zeros((SEMANTIC_CACHE_SIZE, dim), dtype=np.float32)
+        self._cache_k = np.full(SEMANTIC_CACHE_SIZE, -1, dtype=np.int64)
+        self._cache_ntotal = np.full(SEMANTIC_CACHE_SIZE, -1, dtype=np.int64)
+        self._cache_stored = np.full(SEMANTIC_CACHE_SIZE, -np.inf)
+        self._cache_used = np.full(SEMANTIC_CACHE_SIZE, -np.inf)
+        self._cache_results = [None] * SEMANTIC_CACHE_SIZE
+        self._cache_lock = threading.Lock()
+
+    def _semantic_lookup(self, query_embeddings, k):
+        """Cached results per query row, or None where no cached query is close enough."""
+        now = time.monotonic()
+        with self._cache_lock:
+            # Only slots searched with the same k against the current index count
+            valid = (
+                (self._cache_k == k)
+                & (self._cache_ntotal == self.embedder.index.ntotal)
+                & (now - self._cache_stored < SEMANTIC_CACHE_TTL_SECONDS)
+            )
+            if not valid.any():
+                return [None] * len(query_embeddings)
+            # Rows are unit vectors, so the products are cosine similarities
+            scores = np.dot(query_embeddings, self._cache_vecs.T)
+            scores[:, ~valid] = -np.inf
+            best = scores.argmax(axis=1)
+            hits = []
+            for row, slot in enumerate(best.tolist()):
+                if scores[row, slot] >= SEMANTIC_CACHE_THRESHOLD:
+                    self._cache_used[slot] = now
+                    hits.append(self._cache_results[slot])
+                else:
+                    hits.append(None)
+            return hits
+
+    def _semantic_store(self, query_embedding, k, results):
+        """Put fresh results in the least recently used slot."""
+        now = time.monotonic()
+        with self._cache_lock:
+            slot = int(self._cache_used.argmin())
+            self._cache_vecs[slot] = query_embedding
+            self._cache_k[slot] = k
+            self._cache_ntotal[slot] = self.embedder.index.ntotal
+            self._cache_stored[slot] = now
+            self._cache_used[slot] = now
+            self._cache_results[slot] = results
+
+    def _embed(self, queries):
+        """
+        (n, dim) normalized query embeddings, encoding only queries not seen recently.
+
+        The array is this thread's reusable buffer, valid until its next call.
+        """
+        cached = [self._embedding_cache.get(query)[1] for query in queries]
+        missing = list(dict.fromkeys(q for q, vec in zip(queries, cached) if vec is None))
+        if missing:
+            fresh = dict(zip(missing, self.embedder.embed_queries(missing)))
+            for query, vec in fresh.items():
+                self._embedding_cache.put(query, vec)
+            cached = [fresh[q] if vec is None else vec for q, vec in zip(queries, cached)]
+        out = self.embedder.embedding_buffer(len(cached))
+        for row, vec in enumerate(cached):
+            out[row] = vec
+        return out
+
     def retrieve(self, query, k=3):
         """
         Retrieve relevant text chunks for a given query.
         
+        Results are cached, so the returned list must not be modified.
+
         Args:
             query (str): User query
             k (int): Number of chunks to retrieve
-            
+
         Returns:
             list: List of (text, score) tuples
+
+        Raises:
+            Exception: Whatever made encoding the query fail, after logging it
+        """
+        return self.retrieve_batch([query], k=k)[0]
+
+    def retrieve_batch(self, queries, k=3):
         """
+        Retrieve chunks for several queries with one batched encode and search.
+
+        A query whose embedding is within SEMANTIC_CACHE_THRESHOLD cosine
+        similarity of a recently searched one reuses that search's results.
+
+        Args:
+            queries (list): User queries
+            k (int): Number of chunks to retrieve per query
+
+        Returns:
+            list: One list of (text, score) tuples per query
+
+        Raises:
+            Exception: A copy of the error that made a query's retrieval fail,
+                chained to it; repeats re-raise it for NEGATIVE_RESULT_TTL_SECONDS
+        """
+        outcomes = self.retrieve_batch_outcomes(queries, k=k)
+        for outcome in outcomes:
+            if isinstance(outcome, CachedFailure):
+                raise outcome.fresh_error() from outcome.error
+        return outcomes
+
+    def retrieve_batch_outcomes(self, queries, k=3):
+        """
+        Like retrieve_batch, but a query that fails gets a CachedFailure in its
+        place instead of failing the others, which are unaffected by it.
+        """
+        if not queries:
+            return []
+        outcomes = [None] * len(queries)
+        pending = []
+        keys = [(query, k, self.embedder.index.ntotal, self._index_salt) for query in queries]
+        for i, key in enumerate(keys):
+            # Failures cached moments ago come back as is, without encoding or logging
+            found, outcome = self._result_cache.get(key)
+            if found:
+                outcomes[i] = outcome
+            else:
+                pending.append(i)
+        
+        searched = 0
+        if pending:
+            found, searched = self._search_outcomes([queries[i] for i in pending], k)
+            for i, outcome in zip(pending, found):
+                outcomes[i] = outcome
+                # Empty when the search failed or found nothing; either is retried soon
+                short_lived = isinstance(outcome, CachedFailure) or not outcome
+                self._result_cache.put(keys[i], outcome, ttl=NEGATIVE_RESULT_TTL_SECONDS if short_lived else None)
+        
+        log_event("Retrieved chunks for %d queries (%d from cache)", len(queries), len(queries) - searched)
+        return outcomes
+
+    def _search_outcomes(self, queries, k):
+        """(results or CachedFailure per query, number of index searches) for uncached queries."""
         try:
-            results = self.embedder.search(query, k=k)
-            log_event(f"Retrieved {len(results)} chunks for query")
-            return results
-            
+            return self._search(queries, k)
         except Exception as e:
-            log_event(f"Error during retrieval: {str(e)}", level="ERROR")
-            return []
+            if len(queries) == 1:
+                # Surfaced rather than returned as empty results, which callers
+                # would take to mean the knowledge base has nothing relevant
+                log_event("Error during retrieval: %s", e, level="ERROR")
+                return [CachedFailure(e)], 0
+        # One failing query must not fail the rest of the batch: retry one by one
+        outcomes, searched = [], 0
+        for query in queries:
+            found, n = self._search_outcomes([query], k)
+            outcomes.extend(found)
+            searched += n
+        return outcomes, searched
+
+    def _search(self, queries, k):
+        """(results per query, number of index searches), via the semantic cache where possible."""
+        query_embeddings = self._embed(queries)
+        similar = self._semantic_lookup(query_embeddings, k)
+        
+        # Only queries without a near-identical cached one are searched
+        misses = [row for row, result in enumerate(similar) if result is None]
+        if misses:
+            found = self.embedder.search_embeddings(query_embeddings[misses], k=k)
+            for row, result in zip(misses, found):
+                similar[row] = result
+                if result:
+                    self._semantic_store(query_embeddings[row], k, result)
+        return similar, len(misses)
+
+class RetrievalBatcher:
+    """
+    Funnels concurrent retrieve() calls from request threads into retrieve_batch_outcomes().
+
+    A single worker takes whatever queries are waiting and searches them together,
+    so a lone query is served immediately while queries arriving during a search
+    share the next one.
+    """
+
+    def __init__(self, retriever, max_batch=RETRIEVE_MAX_BATCH):
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True, name="retrieval-batcher").start()
+
+    def retrieve(self, query, k=3):
+        """Same contract as FinanceRetriever.retrieve; blocks until the batch is searched."""
+        future = Future()
+        self._queue.put((query, k, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            by_k = defaultdict(list)
+            for query, k, future in batch:
+                by_k[k].append((query, future))
+            for k, pending in by_k.items():
+                try:
+                    outcomes = self.retriever.retrieve_batch_outcomes([query for query, _ in pending], k=k)
+                except Exception as e:
+                    for _, future in pending:
+                        future.set_exception(e)
+                    continue
+                # Requests from other callers share the batch, so a failure
+                # only reaches the caller whose query it belongs to
+                for (_, future), outcome in zip(pending, outcomes):
+                    if isinstance(outcome, CachedFailure):
+                        error = outcome.fresh_error()
+                        error.__cause__ = outcome.error
+                        future.set_exception(error)
+                    else:
+                        future.set_result(outcome)
@@ -1,7 +1,34 @@
+import os
+import time
+import orjson
 import ollama
 
-try:
+# Reruns within this window reuse the last model list instead of asking the server
+MODELS_CACHE_PATH = os.path.join(".cache", "ollama_models.json")
+MODELS_CACHE_TTL_SECONDS = 60
+
+def list_models():
+    """ollama.list() as plain data; only successful probes are cached."""
+    try:
+        if time.time() - os.path.getmtime(MODELS_CACHE_PATH) < MODELS_CACHE_TTL_SECONDS:
+            with open(MODELS_CACHE_PATH, "rb") as f:
+                return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        pass
     models = ollama.list()
+    # Newer clients return a pydantic model rather than a dict
+    if hasattr(models, "model_dump"):
+        models = models.model_dump(mode="json")
+    try:
+        os.makedirs(os.path.dirname(MODELS_CACHE_PATH), exist_ok=True)
+        with open(MODELS_CACHE_PATH, "wb") as f:
+            f.write(orjson.dumps(models))
+    except OSError:
+        pass  # the cache is best-effort
+    return models
+
+try:
+    models = list_models()
     print(f'Available models: {models}')
 except Exception as e:
     print(f'Error connecting to Ollama server: {e}')
@@ -11,16 +11,17 @@ def main():
         "Explain the concepts of risk management in finance"
     ]
     
-    for i, query in enumerate(test_queries):
+    # One batched retrieval, then all generations in flight together
+    start_time = time.perf_counter()
+    responses = llm.generate_batch(test_queries)
+    elapsed_time = time.perf_counter() - start_time
+    
+    for i, (query, response) in enumerate(zip(test_queries, responses)):
         print(f"\nTest #{i+1}: {query}")
-        
-        start_time = time.time()
-        response = llm.generate_response(query)
-        elapsed_time = time.time() - start_time
-        
         print(f"Response: {response}")
-        print(f"Time taken: {elapsed_time:.2f} seconds")
         print("="*50)
+    
+    print(f"\nTime taken for {len(test_queries)} queries: {elapsed_time:.2f} seconds")
 
 if __name__ == "__main__":
     main()
@@ -1,18 +1,309 @@
+import os
 import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import orjson
 
-cache = {}
+DEFAULT_MAX_SIZE = 2000
+DEFAULT_TTL_SECONDS = 300
+# Disk tier for cache_response(), kept across restarts
+RESPONSE_CACHE_DIR = os.path.join(".cache", "responses")
+RESPONSE_CACHE_TTL_SECONDS = 24 * 3600
+# A DiskCache directory is pruned back under this many bytes, least recently used first
+DISK_CACHE_SIZE_LIMIT = 2 ** 30
+# Expired files are swept out at least this often while a DiskCache is written to
+DISK_CACHE_SWEEP_INTERVAL_SECONDS = 3600
 
-def cache_result(func):
-    """Decorator to cache FAISS retrieval results."""
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        cache_key = str(args) + str(kwargs)
-        if cache_key in cache:
-            return cache[cache_key]
-        result = func(*args, **kwargs)
-        cache[cache_key] = result
-        return result
-    return wrapper
+def _freeze(value):
+    """Hashable stand-in for an argument; arrays are keyed by dtype, shape and content."""
+    if isinstance(value, np.ndarray):
+        digest = hashlib.blake2b(np.ascontiguousarray(value).tobytes(), digest_size=16).digest()
+        return ("ndarray", value.dtype.str, value.shape, digest)
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_freeze(item) for item in value))
+    if isinstance(value, dict):
+        # Sorted rather than a frozenset, so repr() (the disk key) is stable across runs
+        items = sorted(((key, _freeze(item)) for key, item in value.items()), key=lambda kv: repr(kv[0]))
+        return ("dict", tuple(items))
+    return value
+
+# The only argument types _freeze() rewrites
+_FROZEN_TYPES = (np.ndarray, list, tuple, dict)
+
+def make_key(*args, **kwargs):
+    """Cache key for a call; raises TypeError if an argument can't be hashed."""
+    items = tuple(sorted(kwargs.items())) if kwargs else ()
+    if any(isinstance(value, _FROZEN_TYPES) for value in (*args, *kwargs.values())):
+        key = (tuple(_freeze(arg) for arg in args), tuple((k, _freeze(v)) for k, v in items))
+    else:
+        # Scalars and objects (e.g. self) already are their own key: skip rebuilding the tuple
+        key = (args, items)
+    hash(key)
+    return key
+
+class DiskCache:
+    """
+    One JSON file per key under ``directory``, named by a hash of the key and
+    written atomically, holding ``{"timestamp": ..., "value": ...}``.
+
+    Entries older than ``ttl`` are misses and are deleted when read or swept.
+    Once the directory grows past ``size_limit`` bytes, the least recently
+    used files (by mtime, which hits refresh) are deleted until it is under
+    90% of it. Sweeps run on a background thread, on the first write and
+    then hourly or when the size estimate passes the limit.
+    """
+
+    def __init__(self, directory, ttl, size_limit=DISK_CACHE_SIZE_LIMIT):
+        self.directory = directory
+        self.ttl = ttl
+        self.size_limit = size_limit
+        self._lock = threading.Lock()
+        # Bytes under directory as of the last sweep plus writes since; None until measured
+        self._size = None
+        self._next_sweep = 0.0
+        self._sweeping = False
+
+    def _path(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key):
+        """(found, age in seconds, value) for the string ``key``."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = orjson.loads(f.read())
+            age = time.time() - entry["timestamp"]
+        except (OSError, orjson.JSONDecodeError, KeyError, TypeError):
+            return False, 0.0, None
+        if age >= self.ttl:
+            self._remove(path)
+            return False, 0.0, None
+        try:
+            os.utime(path)  # recently used, as far as the size cap is concerned
+        except OSError:
+            pass
+        return True, age, entry["value"]
+
+    def put(self, key, value):
+        """Store ``value``; raises OSError, or TypeError if it isn't JSON-serializable."""
+        data = orjson.dumps({"timestamp": time.time(), "value": value})
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+            due = (self._size is None or self._size > self.size_limit
+                   or time.monotonic() >= self._next_sweep)
+            if not due or self._sweeping:
+                return
+            self._sweeping = True
+        threading.Thread(target=self.prune, daemon=True, name="disk-cache-prune").start()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def prune(self):
+        """Delete expired files, then least recently used ones while over ``size_limit``."""
+        size = None
+        try:
+            now = time.time()
+            files = []
+            # Walked recursively, so files from older layouts expire too
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    # Untouched for a whole TTL means written (and stamped) earlier still
+                    if now - st.st_mtime >= self.ttl:
+                        self._remove(path)
+                    else:
+                        files.append((st.st_mtime, st.st_size, path))
+            size = sum(file_size for _, file_size, _ in files)
+            if size > self.size_limit:
+                files.sort()
+                for _, file_size, path in files:
+                    if size <= self.size_limit * 0.9:
+                        break
+                    if self._remove(path):
+                        size -= file_size
+        finally:
+            with self._lock:
+                if size is not None:
+                    self._size = size
+                self._next_sweep = time.monotonic() + DISK_CACHE_SWEEP_INTERVAL_SECONDS
+                self._sweeping = False
+
+class ResultCache:
+    """
+    Bounded LRU cache whose entries expire ``ttl`` seconds after being stored.
+
+    With ``persist_dir`` every entry is also written to a DiskCache there,
+    keyed by ``repr(key)``, and memory misses are looked up on disk, so
+    entries survive restarts. That needs keys with a stable repr and
+    JSON-serializable values (tuples come back as lists). Entries put with
+    their own ``ttl`` are kept in memory only.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL_SECONDS, persist_dir=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_dir = persist_dir
+        self._disk = DiskCache(persist_dir, ttl) if persist_dir is not None else None
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (True, value) for a live entry, else (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+        if self._disk is not None:
+            found, age, value = self._disk.get(repr(key))
+            if found:
+                with self._lock:
+                    # Expires when the disk entry would, not a full TTL from now
+                    self._insert(key, time.monotonic() - age + self.ttl, value)
+                    self.hits += 1
+                return True, value
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key, value, ttl=None):
+        """Store ``value`` for the cache's TTL, or for ``ttl`` seconds in memory only."""
+        with self._lock:
+            self._insert(key, time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        if self._disk is not None and ttl is None:
+            try:
+                self._disk.put(repr(key), value)
+            except (OSError, TypeError):
+                pass  # the disk tier is best-effort
+
+    def _insert(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class CachedFailure:
+    """Cache entry standing for a call that raised, so the error is replayed rather than retried."""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+    def fresh_error(self):
+        """
+        New exception like the cached one, to ``raise ... from self.error``.
+
+        Raising the cached instance again would keep appending tracebacks to it.
+        """
+        try:
+            return type(self.error)(*self.error.args)
+        except Exception:
+            return RuntimeError(str(self.error))
+
+def is_empty_result(result):
+    """None or an empty list, tuple or dict: what a search that found nothing returns."""
+    return result is None or (isinstance(result, (list, tuple, dict)) and not result)
+
+def cache_result(func=None, *, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL_SECONDS, persist_dir=None, neg_ttl=None):
+    """
+    Decorator to cache FAISS retrieval results.
+
+    Usable bare or as ``@cache_result(max_size=..., ttl=..., persist_dir=...)``.
+    The wrapper's ``cache`` attribute is its ResultCache (see ``cache.stats``).
+    Calls with unhashable arguments are not cached.
+
+    With ``neg_ttl``, empty results (see ``is_empty_result``) and raised
+    exceptions are cached for only that many seconds, so a failing backend
+    isn't hit on every repeat; hits re-raise a copy chained to the original.
+    """
+    def decorator(func):
+        cache = ResultCache(max_size=max_size, ttl=ttl, persist_dir=persist_dir)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                key = make_key(*args, **kwargs)
+            except TypeError:
+                return func(*args, **kwargs)
+            found, result = cache.get(key)
+            if found:
+                if isinstance(result, CachedFailure):
+                    raise result.fresh_error() from result.error
+                return result
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if neg_ttl is not None:
+                    cache.put(key, CachedFailure(e), ttl=neg_ttl)
+                raise
+            if neg_ttl is not None and is_empty_result(result):
+                cache.put(key, result, ttl=neg_ttl)
+            else:
+                cache.put(key, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
+
+_response_cache = ResultCache(ttl=RESPONSE_CACHE_TTL_SECONDS, persist_dir=RESPONSE_CACHE_DIR)
+
+# Store in cache
+def cache_response(query, response):
+    _response_cache.put(query, response)
+
+def get_cached_response(query):
+    """Response stored with cache_response(), or None."""
+    return _response_cache.get(query)[1]
 
 if __name__ == "__main__":
     @cache_result
@@ -21,9 +312,4 @@ if __name__ == "__main__":
 
     print(slow_function(5))  # First call (computes)
     print(slow_function(5))  # Second call (cached)
-
-# Store in cache
-def cache_response(query, response):
-    cache = load_cache()
-    cache[query] = response
-    save_cache(cache)
+    print(slow_function.cache.stats)
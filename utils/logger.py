@@ -1,20 +1,94 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 
-# Configure logging
-logging.basicConfig(
-    filename="chatbot_logs.txt",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
-
-def log_event(message, level="INFO"):
-    """Logs messages for debugging and performance tracking."""
-    if level == "INFO":
-        logging.info(message)
-    elif level == "WARNING":
-        logging.warning(message)
-    elif level == "ERROR":
-        logging.error(message)
+LOG_FILE = "chatbot_logs.txt"
+LOG_BUFFER_SIZE = 65536
+# chatbot_logs.txt is rolled over to chatbot_logs.txt.1 ... .5 at this size
+LOG_MAX_BYTES = 10 << 20
+LOG_BACKUP_COUNT = 5
+
+class _BufferedFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler writing through a large buffer, flushed by its listener rather than per record."""
+
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=LOG_BUFFER_SIZE, encoding=self.encoding)
+        # Running size for rollover: the stock check seeks the stream, which
+        # flushes the buffer on every record
+        self._size = os.fstat(stream.fileno()).st_size
+        return stream
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self._size and self._size + len(msg) > self.maxBytes:
+                self.doRollover()
+            self.stream.write(msg)
+            self._size += len(msg)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        pass
+
+    def flush_buffer(self):
+        super().flush()
+
+    def close(self):
+        self.flush_buffer()
+        super().close()
+
+class _DrainingListener(logging.handlers.QueueListener):
+    """Writes records as they arrive and flushes the file whenever the queue runs dry."""
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush_buffer()
+            return self.queue.get(block)
+
+# Configure logging: callers only enqueue records; a background thread does the file I/O
+_file_handler = _BufferedFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+_file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+_queue = queue.Queue(-1)
+_listener = _DrainingListener(_queue, _file_handler)
+_listener.start()
+atexit.register(_listener.stop)
+
+# A dedicated logger: records skip the root logger's handlers, and other
+# libraries' logging no longer lands in the chatbot's file
+_logger = logging.getLogger("chatbot")
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+_logger.addHandler(logging.handlers.QueueHandler(_queue))
+
+_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+
+def log_event(message, *args, level="INFO"):
+    """Logs messages for debugging and performance tracking.
+
+    Extra ``args`` are %-formatted into ``message`` only when ``level`` is
+    enabled, so callers can pass objects instead of pre-rendered strings.
+    """
+    levelno = _LEVELS.get(level)
+    if levelno is not None and _logger.isEnabledFor(levelno):
+        _logger.log(levelno, message, *args)
+
+def log_enabled(level="INFO"):
+    """Whether ``log_event`` at ``level`` would be written, to skip building costly messages."""
+    levelno = _LEVELS.get(level)
+    return levelno is not None and _logger.isEnabledFor(levelno)
 
 if __name__ == "__main__":
     log_event("Chatbot started successfully.")